@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+'''
+This script measures the memory used by the most common sdf objects (Page, DataPage, TablePage,
+Column and LvData), compared to the same classes without __slots__, on a large synthetic set of
+objects. If SDF game files are given, it also measures the peak memory used while decoding all
+the rows of all their tables.
+'''
+
+import sys
+import os
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import sdf
+from rags2html import key_gen
+
+def print_err(msg):
+    print(str(msg), file=sys.stderr)
+
+def open_db(fpath):
+    # Not encrypted if none of the keys match
+    return sdf.DataBase(fpath, probe=sdf.probe_file(fpath, (key_gen('F1$asDDFHappy'),
+            key_gen('DBPassword'))))
+
+def without_slots(cls):
+    '''Return a copy of the class that stores its attributes in a __dict__.'''
+    skip = set(cls.__slots__) | {'__slots__', '__dict__', '__weakref__'}
+    ns = {k: v for k, v in cls.__dict__.items() if k not in skip}
+    return type(cls.__name__, cls.__bases__, ns)
+
+def make_page_data(pageType):
+    data = bytearray(4096)
+    data[4:8] = ((pageType << 20) | 1).to_bytes(4, 'little')
+    return bytes(data)
+
+DATA_PAGE = sdf.Page(1, sdf.PageType.DATA, make_page_data(sdf.PageType.DATA), 0)
+TABLE_PAGE = sdf.Page(2, sdf.PageType.TABLE, make_page_data(sdf.PageType.TABLE), 0)
+
+# Objects to create for each class (the page data is shared, only the objects are measured)
+FACTORIES = [
+    (sdf.Page, lambda cls, i: cls(i, sdf.PageType.DATA, DATA_PAGE.data, i)),
+    (sdf.DataPage, lambda cls, i: cls(DATA_PAGE)),
+    (sdf.TablePage, lambda cls, i: cls(TABLE_PAGE, None)),
+    (sdf.Column, lambda cls, i: cls(i, i, 'Column', sdf.Column.TYPE_INTEGER)),
+    (sdf.LvData, lambda cls, i: cls([i, i + 1, i + 2], 3 * (4096 - 16))),
+]
+
+def measure(factory, cls, count):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(cls, i) for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0] - before - sys.getsizeof(objects)
+    tracemalloc.stop()
+    del objects
+    return size / count
+
+def bench_objects(count):
+    print('%-12s %14s %14s %8s' % ('class', '__dict__', '__slots__', 'saved'))
+    for cls, factory in FACTORIES:
+        withDict = measure(factory, without_slots(cls), count)
+        withSlots = measure(factory, cls, count)
+        print('%-12s %10.0f B/o %10.0f B/o %7.0f%%' % (cls.__name__, withDict, withSlots,
+                100 * (withDict - withSlots) / withDict))
+
+def bench_file(fpath):
+    print('[%s]' % (fpath,))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = 0
+    with open_db(fpath) as db:
+        for table in db.tables.values():
+            for record in db.getTablePage(table):
+                table.extractRow(record, sortByIndex=True)
+                rows += 1
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print('%d rows in %.2fs, peak memory %.1f MiB' % (rows, elapsed, peak / 1024 / 1024))
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark sdf objects memory usage')
+    parser.add_argument('rag_file', nargs='*')
+    parser.add_argument('-n', '--count', type=int, default=100000, help='number of objects created per class (default: 100000)')
+
+    args = parser.parse_args(args=argv[1:])
+
+    sdf.DEBUG_TRACE = False
+
+    bench_objects(args.count)
+    for fpath in args.rag_file:
+        bench_file(fpath)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+'''
+This script checks that the NumPy page checksum (do_checksum_np) gives the same results as the
+pure-Python one (do_checksum_py) on random 4 KB pages, on pages filled with the same byte, and on
+odd and short lengths.
+'''
+
+import sys
+import os
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import sdf
+
+def print_err(msg):
+    print(str(msg), file=sys.stderr)
+
+def check(data):
+    expected = sdf.do_checksum_py(data)
+    result = sdf.do_checksum_np(data)
+    assert result == expected, 'checksum mismatch for %d bytes: %08x != %08x' % (len(data),
+            result, expected)
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Check the NumPy page checksum against the pure-Python one')
+    parser.add_argument('-n', '--count', type=int, default=1000, help='number of random pages checked (default: 1000)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='random seed (default: 0)')
+
+    args = parser.parse_args(args=argv[1:])
+
+    if sdf.numpy is None:
+        print_err('Error: NumPy is not installed')
+        return 1
+
+    rand = random.Random(args.seed)
+
+    # Random pages, as checksummed by DataBase (without the checksum field) and in full
+    for _ in range(args.count):
+        page = rand.randbytes(4096)
+        check(page[4:])
+        check(page)
+        check(memoryview(page)[4:])
+
+    # Pages with a single byte value (0xFF pages hit the fold to 0 case)
+    for value in (0x00, 0x01, 0x7F, 0x80, 0xFE, 0xFF):
+        check(bytes([value]) * 4096)
+        check(bytes([value]) * 4092)
+
+    # Odd and short lengths
+    for size in list(range(0, 64)) + [4091, 4093, 4095, 4097]:
+        for _ in range(10):
+            check(rand.randbytes(size))
+        check(b'\xff' * size)
+
+    print('OK')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -39,6 +39,24 @@ def key_gen(key_str, val=129):
 
     return wkey
 
+# Games made with older RAGS versions (< 1.7?) are encrypted with AES-256-CBC with this key and IV
+NRBF_KEY = bytes.fromhex('B4BDC259B1104A6531F8109C851BCF9AD09BDD208851C9CBAB782AEC356CC1E3')
+NRBF_IV = bytes.fromhex('31F8109C851BCF9A203D6C71A7BD1487')
+
+def nrbf_decryptor():
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    return Cipher(algorithms.AES(NRBF_KEY), modes.CBC(NRBF_IV)).decryptor()
+
+def is_nrbf(header):
+    '''Check if the first bytes of the file (e.g. FileProbe.header) are an encrypted NRBF stream.'''
+    if len(header) < 32:
+        return False
+
+    # SerializationHeaderRecord: RecordTypeEnum (0), RootId, HeaderId, MajorVersion (1) and
+    # MinorVersion (0)
+    data = nrbf_decryptor().update(bytes(header[:32]))
+    return data[0] == 0 and data[9:17] == b'\x01\x00\x00\x00\x00\x00\x00\x00'
+
 def json_encode(v):
     if isinstance(v, datetime.datetime):
         # Convert to POSIX timestamp in ms (same as what JS uses)
@@ -1326,6 +1344,12 @@ PROPERTIES_KEYS = {
 }
 
 async def process_file(fpath, keys, args, progress=None):
+    # The header is read once to try all the keys and to detect the file format
+    with sdf.probe_file(fpath, keys) as probe:
+        # The probe file handle is closed on errors, unless DataBase() took it over
+        await process_probed_file(fpath, probe, args, progress=progress)
+
+async def process_probed_file(fpath, probe, args, progress=None):
         if args.out_dir is not None:
             dir_name = os.path.splitext(os.path.basename(fpath))[0]
             out_dir = os.path.join(args.out_dir, dir_name)
@@ -1335,13 +1359,9 @@ async def process_file(fpath, keys, args, progress=None):
         if args.data_debug:
             data_dir = os.path.join(out_dir, 'data')
 
-        key = None
-        for k in keys:
-            if sdf.check_key(fpath, k):
-                key = k
-                break
+        key = probe.key
 
-        if key is None:
+        if key is None and is_nrbf(probe.header):
             # Games made with older RAGS versions (< 1.7?)
             # The whole game file is encrypted with AES-256-CBC
             # Its content is made from BinaryFormatter, not a sqlce DB
@@ -1352,16 +1372,13 @@ async def process_file(fpath, keys, args, progress=None):
             if progress is not None:
                 progress(0.0, 'Decrypting file...', -1)
 
-            from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-
-            key = bytes.fromhex('B4BDC259B1104A6531F8109C851BCF9AD09BDD208851C9CBAB782AEC356CC1E3')
-            iv = bytes.fromhex('31F8109C851BCF9A203D6C71A7BD1487')
-            decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+            decryptor = nrbf_decryptor()
 
             # Decrypt the file in memory
             # (old game files are small so they should fit in memory)
-            with open(fpath, 'rb') as fh:
-                data = decryptor.update(fh.read()) + decryptor.finalize()
+            with probe:
+                data = decryptor.update(probe.header)
+                data += decryptor.update(probe.fh.read()) + decryptor.finalize()
 
             if args.decrypt_only:
                 out_fpath = fpath + '.bin'
@@ -1893,10 +1910,11 @@ async def process_file(fpath, keys, args, progress=None):
                     progress(0, 'Loading file...', -1)
                 await asyncio.sleep(0)
                 if args.decrypt_only:
-                    sdf.DataBase(fpath, key, _decrypt_only=True)
+                    sdf.DataBase(fpath, probe=probe, _decrypt_only=True).close()
                     return
 
-                with sdf.DataBase(fpath, key) as db:
+                with sdf.DataBase(fpath, workers=args.threads, index=args.index or None,
+                        probe=probe) as db:
                     if args.info:
                         table = db.tables['GameData']
                         page = db.readPage(table.pageId)
@@ -1968,8 +1986,11 @@ async def process_file(fpath, keys, args, progress=None):
                         rows = []
                         for idx, record in enumerate(tablePage):
                             if progress is not None:
-                                cur_progress = start_progress + progress_step * idx / tablePage.getCount()
-                                progress(cur_progress, progress_task, idx, tablePage.getCount())
+                                # Records are streamed, their count is not known in advance
+                                done, total = tablePage.progress
+                                if total > 0:
+                                    cur_progress = start_progress + progress_step * done / total
+                                    progress(cur_progress, progress_task, done, total)
                             await asyncio.sleep(0)
 
                             if record is None:
@@ -1979,7 +2000,8 @@ async def process_file(fpath, keys, args, progress=None):
                             entry = {}
                             for name, value in row.items():
                                 if isinstance(value, sdf.LvData):
-                                    if not (skip_media and name == 'Data'):
+                                    # Media data are streamed to their file below
+                                    if not (table.name == 'Media' and name == 'Data'):
                                         value = value.extract(db)
 
                                 if is_action and name == 'Data':
@@ -2004,7 +2026,10 @@ async def process_file(fpath, keys, args, progress=None):
 
                                 if not skip_media:
                                     with open(media_fpath, 'wb') as out:
-                                        out.write(entry['Data'])
+                                        if isinstance(entry['Data'], sdf.LvData):
+                                            entry['Data'].extractTo(db, out)
+                                        else:
+                                            out.write(entry['Data'])
                                 del entry['Data']
                                 entry['FilePath'] = 'images/' + fname
 
@@ -2238,6 +2263,8 @@ async def process_file(fpath, keys, args, progress=None):
                                     guids[guid] = name
 
                 print('COVER: ' + db.pageCoverStats())
+                if args.metrics:
+                    print('METRICS: ' + json.dumps(db.getMetrics()))
                 await asyncio.sleep(0)
 
             except:
@@ -2352,6 +2379,9 @@ async def main(argv, progress=None):
     parser.add_argument('--decrypt-only', action='store_true', help='only decrypt the game file (for debugging)')
     parser.add_argument('--rags-compat', action='store_true', help='produce JS code as close as what RAGS produces')
     parser.add_argument('-o', '--out-dir', help='base output directory (default: game file folder)')
+    parser.add_argument('-j', '--threads', type=int, help='number of threads used to decrypt the game file (default: 1)', default=1)
+    parser.add_argument('--index', action='store_true', help='store the game file structure in a sidecar file (.sdfidx) to load it faster next time')
+    parser.add_argument('--metrics', action='store_true', help='show the game file reading metrics (pages, bytes, timings, ...)')
 
     args = parser.parse_args(args=argv[1:])
 
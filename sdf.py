@@ -6,14 +6,38 @@ B-Tree pages are not supported, and only version 3.5 or earlier have been tested
 '''
 
 import sys
+import array
+import base64
+import bisect
+import contextlib
+import gzip
+import hashlib
+import io
+import json
 import struct
 import math
 import os
 import re
-from collections import defaultdict
+import threading
+import time
+import types
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import cmp_to_key
 from datetime import datetime, timedelta
 
+try:
+    import mmap
+except ImportError:
+    # Not available on some platforms (e.g. Pyodide)
+    mmap = None
+
+try:
+    # pip3 install numpy (optional, for faster checksums)
+    import numpy
+except ImportError:
+    numpy = None
+
 # pip3 install cryptography
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
@@ -49,20 +73,75 @@ def BYTE(buf, pos=0):
 def print_err(msg):
     print(str(msg), file=sys.stderr)
 
-def debug_trace(msg, *args):
-    if not DEBUG_TRACE:
-        return
+def clean_string(str):
+    # Remove extra characters after the first NUL character
+    return str.split('\0', 1)[0]
+
+class DebugTrace:
+    '''
+    Ring buffer of the last DEBUG_TRACE_LEN traced calls. The calls are stored as (fmt, args)
+    and only formatted when the history is read, so tracing can be left enabled. Hot code
+    paths check DEBUG_TRACE before calling it, so tracing costs nothing when disabled.
+
+    Immutable args (numbers, strings, bytes) are stored as is. Other args are stored as a
+    snapshot taken at call time (a copy of binary data and containers, a Page without its data,
+    the str() of other objects), so the history shows their state when the call was traced and
+    does not keep pages (or mmap views) alive.
+    '''
+    IMMUTABLE_TYPES = (int, float, str, bytes, type(None))
+
+    def __init__(self):
+        self.entries = deque(maxlen=DEBUG_TRACE_LEN)
+        self.lastTable = None
+        self.lastPage = None
+
+    def __call__(self, fmt, *args):
+        if not DEBUG_TRACE:
+            return
+
+        entries = self.entries
+        if entries.maxlen != DEBUG_TRACE_LEN:
+            # DEBUG_TRACE_LEN changed
+            entries = self.entries = deque(entries, maxlen=DEBUG_TRACE_LEN)
+        immutable = self.IMMUTABLE_TYPES
+        entries.append((fmt, tuple([arg if isinstance(arg, immutable) else self.snapshot(arg)
+                for arg in args])))
+
+    @staticmethod
+    def snapshot(arg):
+        if isinstance(arg, memoryview):
+            # Records are views of the pages, keep their content instead
+            return bytes(arg)
+        if isinstance(arg, (bytearray, list, dict, set)):
+            return type(arg)(arg)
+        if isinstance(arg, Page):
+            # Only the page header is shown (cheaper than str())
+            return Page(arg.id, arg.type, None, arg.address, decrypted=arg.decrypted)
+        return str(arg)
+
+    @staticmethod
+    def format(fmt, args):
+        try:
+            return fmt % args
+        except (TypeError, ValueError) as e:
+            return '%s %r (%s)' % (fmt, args, e)
+
+    @property
+    def history(self):
+        '''
+        The formatted messages, from the oldest to the most recent.
+        '''
+        return [self.format(fmt, args) for fmt, args in self.entries]
+
+    def clear(self):
+        self.entries.clear()
+        self.lastTable = None
+        self.lastPage = None
 
-    debug_trace.history.append(msg % args)
-    if len(debug_trace.history) > 2 * DEBUG_TRACE_LEN:
-        debug_trace.history = debug_trace.history[-DEBUG_TRACE_LEN:]
-# TODO Use a queue instead?
-debug_trace.history = []
-debug_trace.lastTable = None
-debug_trace.lastPage = None
+debug_trace = DebugTrace()
 
 default_iv = bytearray(16)  # 16 zero bytes
-def decrypt_bytes(key_hash, data_key, data):
+def derive_key(key_hash, data_key):
     hash1 = key_hash.copy()
     hash1.update(data_key)
     hash1 = hash1.finalize()
@@ -82,28 +161,155 @@ def decrypt_bytes(key_hash, data_key, data):
     # digest.update(buffer2)
     # key += digest.finalize()
 
-    decryptor = Cipher(algorithms.AES(key[:16]), modes.CBC(default_iv)).decryptor()
+    return key[:16]
+
+def make_cipher(key_hash, data_key):
+    return Cipher(algorithms.AES(derive_key(key_hash, data_key)), modes.CBC(default_iv))
+
+def decrypt_bytes(key_hash, data_key, data, cipher=None):
+    if cipher is None:
+        cipher = make_cipher(key_hash, data_key)
+    decryptor = cipher.decryptor()
     return decryptor.update(data) + decryptor.finalize()
 
-def check_key(fpath, key):
-    key_hash = hashes.Hash(hashes.SHA1())
-    key_hash.update(key)
+class KeyCache:
+    '''
+    Bounded LRU cache of the ciphers derived from the global key and the page data keys
+    (checksums), so pages sharing the same checksum only derive their key once.
+    It can be used from several threads.
+    '''
+    def __init__(self, key_hash, maxSize=1024):
+        self.key_hash = key_hash
+        self.maxSize = maxSize
+        self.ciphers = OrderedDict()
+        self.lock = threading.Lock()
 
-    with open(fpath, 'rb') as fh:
-        page = fh.read(4096)
-        if len(page) != 4096:
-            return False
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return 'KeyCache<keys=%d, hits=%d, misses=%d>' % (len(self.ciphers), self.hits,
+                self.misses)
+
+    def __str__(self):
+        return repr(self)
+
+    def __len__(self):
+        return len(self.ciphers)
+
+    def get(self, data_key):
+        data_key = bytes(data_key)
+        with self.lock:
+            cipher = self.ciphers.get(data_key)
+            if cipher is not None:
+                self.hits += 1
+                self.ciphers.move_to_end(data_key)
+                return cipher
+
+            # key_hash is shared, so the key is derived under the lock too
+            self.misses += 1
+            cipher = self.ciphers[data_key] = make_cipher(self.key_hash, data_key)
+            if len(self.ciphers) > self.maxSize:
+                self.ciphers.popitem(last=False)
+            return cipher
+
+    def decrypt(self, data_key, data):
+        return decrypt_bytes(self.key_hash, data_key, data, cipher=self.get(data_key))
+
+    def stats(self):
+        return {
+            'keys': len(self.ciphers),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+class FileProbe:
+    '''
+    File handle and header page (page 0) of a database file, read once to find which of the
+    candidate keys is the right one (see probe_file()). It can be given to DataBase(), which
+    then takes over the file handle and reuses the header page and the key hash instead of
+    reading and hashing them again.
+    '''
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self.fh = open(fpath, 'rb')
+        self.header = self.fh.read(4096)  # May be shorter if the file is too small
+        self.key = None
+        self.key_hash = None
+
+    def __repr__(self):
+        return 'FileProbe<%s, key=%s>' % (self.fpath, 'n/a' if self.key is None else 'found')
+
+    def __str__(self):
+        return repr(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+    def detach(self):
+        '''Return the file handle, which is not closed by the probe anymore.'''
+        fh = self.fh
+        self.fh = None
+        return fh
+
+    def checkKey(self, key):
+        '''Return the SHA1 hash of the key if it matches the key check of the header, else None.'''
+        if len(self.header) != 4096:
+            return None
+
+        key_hash = hashes.Hash(hashes.SHA1())
+        key_hash.update(key)
 
         # Check key from header
-        data_key = page[188:188+4]
-        key_check = page[76:76+0x60]
+        data_key = self.header[188:188+4]
+        key_check = self.header[76:76+0x60]
         key_check = decrypt_bytes(key_hash, data_key, key_check)
         if key != key_check[:len(key)]:
-            return False
+            return None
+
+        return key_hash
+
+    def findKey(self, keys):
+        '''Set key and key_hash to the first of the keys that matches. Return that key or None.'''
+        for key in keys:
+            key_hash = self.checkKey(key)
+            if key_hash is not None:
+                self.key = key
+                self.key_hash = key_hash
+                break
+        return self.key
+
+def probe_file(fpath, keys=()):
+    '''
+    Open the file, read its header page and try each of the keys on it. The returned FileProbe
+    should be given to DataBase() or closed.
+    '''
+    probe = FileProbe(fpath)
+    probe.findKey(keys)
+    return probe
+
+def check_key(fpath, key):
+    with FileProbe(fpath) as probe:
+        return probe.checkKey(key) is not None
+
+def _checksum_fold(sum1, sum2):
+    while(sum1 > 0xFFFF): sum1 = (sum1 & 0xFFFF) + (sum1 >> 16)
+    while(sum2 > 0xFFFF): sum2 = (sum2 & 0xFFFF) + (sum2 >> 16)
+
+    if sum1 == 0xFFFF: sum1 = 0
+    if sum2 == 0xFFFF: sum2 = 0
 
-    return True
+    return sum1 * 0xFFFF + sum2
 
-def do_checksum(data):
+def do_checksum_py(data):
     i = 0
     sum1 = 0
     sum2 = 0
@@ -116,13 +322,39 @@ def do_checksum(data):
         sum1 += data[-1]
         sum2 += sum1
 
-    while(sum1 > 0xFFFF): sum1 = (sum1 & 0xFFFF) + (sum1 >> 16)
-    while(sum2 > 0xFFFF): sum2 = (sum2 & 0xFFFF) + (sum2 >> 16)
+    return _checksum_fold(sum1, sum2)
 
-    if sum1 == 0xFFFF: sum1 = 0
-    if sum2 == 0xFFFF: sum2 = 0
+def do_checksum_np(data):
+    count = len(data) // 2
+    if count >= 0x1000000:
+        # sum2 could overflow 64 bits
+        return do_checksum_py(data)
 
-    return sum1 * 0xFFFF + sum2
+    sum1 = 0
+    sum2 = 0
+    if count > 0:
+        # sum1 is the sum of the little-endian words, sum2 is the sum of all the partial sums1
+        sums = numpy.cumsum(numpy.frombuffer(data, dtype='<u2', count=count), dtype=numpy.uint64)
+        sum1 = int(sums[-1])
+        sum2 = int(sums.sum(dtype=numpy.uint64))
+
+    if len(data) & 1 != 0:
+        sum1 += data[-1]
+        sum2 += sum1
+
+    return _checksum_fold(sum1, sum2)
+
+do_checksum = do_checksum_py if numpy is None else do_checksum_np
+
+# NumPy dtypes and array.array typecodes for Column.STRUCT_CODES
+NUMPY_CODES = {
+    'B': '<u1', 'h': '<i2', 'H': '<u2', 'l': '<i4', 'L': '<u4', 'q': '<i8', 'Q': '<u8',
+    'f': '<f4', 'd': '<f8', 'll': ('<i4', (2,)),
+}
+ARRAY_CODES = {
+    'B': 'B', 'h': 'h', 'H': 'H', 'l': 'i' if array.array('i').itemsize == 4 else 'l',
+    'L': 'I' if array.array('I').itemsize == 4 else 'L', 'q': 'q', 'Q': 'Q', 'f': 'f', 'd': 'd',
+}
 
 class PageType:
     HEADER  = 0
@@ -147,6 +379,8 @@ class PageType:
         return 'TYPE_%d' % (self.value,)
 
 class Page:
+    __slots__ = ('id', 'type', 'data', 'address', 'decrypted')
+
     def __init__(self, id, type, data, address=None, decrypted=True):
         self.id = id
         self.type = type
@@ -165,6 +399,8 @@ class DataPage:
     A DATA page stores a list of arbitraty data entries (blocs).
     An full entry can be stored on multiple pages.
     '''
+    __slots__ = ('page', 'view', 'tablePageId', 'freeSize', 'entriesCount', 'dataSize')
+
     def __init__(self, page):
         '''
         DATA table:
@@ -185,6 +421,8 @@ class DataPage:
         debug_trace.lastPage = self
 
         self.page = page
+        # Entries are returned as slices of this view (no copy)
+        self.view = memoryview(page.data)
 
         if page.type != PageType.DATA:
             raise ValueError('page %05x (at %08x) is not a DATA page' % (page.id, page.address))
@@ -196,10 +434,6 @@ class DataPage:
         self.entriesCount = dword & 0xFFF
         self.dataSize = (dword >> 12) & 0xFFF
 
-        # DEBUG
-        self.lastEntry = None
-        self.lastEntryOffset = None
-
     def __repr__(self):
         return 'DataPage<page=%s>' % (self.page)
 
@@ -233,8 +467,9 @@ class DataPage:
             yield self.getEntry(i)
 
     def getEntry(self, i):
-        debug_trace('DataPage.getEntry(%s, %d)', self.page, i)
-        debug_trace.lastPage = self
+        if DEBUG_TRACE:
+            debug_trace('DataPage.getEntry(%s, %d)', self.page, i)
+            debug_trace.lastPage = self
 
         if i < 0 or i >= self.entriesCount:
             raise IndexError('index out of range')
@@ -259,16 +494,16 @@ class DataPage:
         start = entryOffset + 16 + 8
         end = start + entrySize
 
-        self.lastEntry = i
-        self.lastEntryOffset = start
-
-        return (flags, self.page.data[start:end])
+        return (flags, self.view[start:end])
 
 class TablePage:
     '''
     A TABLE page stores references to DATA pages where the table rows are stored.
     They might also be referenced through BITMAP pages.
     '''
+    __slots__ = ('page', 'db', 'dataListOffset', 'dataPageCount', 'flags', 'bmapPageCount',
+            'bmapListOffset', 'lastDataPage', 'records', 'ready', 'progress')
+
     def __init__(self, page, db):
         '''
         TABLE page:
@@ -315,6 +550,9 @@ class TablePage:
         self.lastDataPage = None
         self.records = []
         self.ready = False
+        # (done, total) of the current iteration: DATA pages walked, or records read if the
+        # records are mapped (the number of records is not known before the walk)
+        self.progress = (0, 0)
 
     def __repr__(self):
         return 'TablePage<page=%s>' % (self.page)
@@ -322,10 +560,32 @@ class TablePage:
     def __str__(self):
         return repr(self)
 
-    def _initialize(self):
+    def _loadRecordMap(self):
+        '''
+        Use the records stored in the database index, if any. Return True if they were found.
+        '''
         if self.ready:
+            return True
+
+        records = self.db.getRecordMap(self.page.id)
+        if records is None:
+            return False
+
+        self.records = records
+        self.ready = True
+        return True
+
+    def _initialize(self):
+        if self._loadRecordMap():
             return
 
+        # Visit all the DATA pages to map the records to them
+        self.records = [chain for chain, _ in self._iterRecords(assemble=False)]
+
+        self.db.setRecordMap(self.page.id, self.records)
+        self.ready = True
+
+    def _getDataPageIds(self):
         dataPageIds = []
         dataPageIdSet = set()
         for i in range(self.dataPageCount):
@@ -351,7 +611,7 @@ class TablePage:
                             % (repr(self),))
                     # It means there are no DATA page in the current BITMAP range?
                 else:
-                    self.lastDataPage = bmapPage = BitmapPage(self.db.readPage(id, validate=True))
+                    bmapPage = BitmapPage(self.db.readPage(id, validate=True))
                     for dataPageId in bmapPage:
                         pageFound += 1
                         dataPageId += pageIdBase
@@ -365,11 +625,18 @@ class TablePage:
                 print_err('Warning: found more pages in BITMAP than expected for %s (%d > %d)'
                         % (repr(self), pageFound, self.bmapPageCount))
 
-        self.records = []
-        # Visit all the DATA pages to map the records to them
-        for id in dataPageIds:
-            self.lastDataPage = DataPage(self.db.readPage(id, validate=True))
-            for idx, (flags, entry) in enumerate(self.lastDataPage):
+        return dataPageIds
+
+    def _iterRecords(self, assemble=True):
+        '''
+        Walk the DATA pages in order and generate (chain, data) for each record as soon as all
+        its entries are read. chain is the list of (pageId, entryIdx) of the record entries and
+        data is the record content (None if assemble is False).
+        '''
+        dataPageIds = self._getDataPageIds()
+        for n, (id, dataPage) in enumerate(self._iterDataPages(dataPageIds)):
+            self.progress = (n, len(dataPageIds))
+            for idx, (flags, entry) in enumerate(dataPage):
                 if entry is None:
                     continue
 
@@ -377,19 +644,35 @@ class TablePage:
                     # Continuation of previous record
                     continue
 
-                self.records.append([(id, idx)])
+                chain = [(id, idx)]
+                # Records stored in a single entry are not copied
+                data = entry if assemble else None
 
                 nextChunk = DWORD(entry)
                 nextChunk = (nextChunk >> 12, nextChunk & 0xFFF)  # pageId, entryId
                 while nextChunk[0] != 0:
                     # Data continue in another page/entry
-                    self.records[-1].append(nextChunk)
-                    otherPage = DataPage(self.db.readPage(nextChunk[0], validate=True))
+                    chain.append(nextChunk)
+                    otherPage = self.db.readDataPage(nextChunk[0])
                     entry = otherPage.getEntry(nextChunk[1])[1]
+                    if assemble:
+                        if not isinstance(data, bytearray):
+                            data = bytearray(data)
+                        # Remove the first 4 bytes when adding continuation entries
+                        data += entry[4:]
                     nextChunk = DWORD(entry)
                     nextChunk = (nextChunk >> 12, nextChunk & 0xFFF)  # pageId, entryId
 
-        self.ready = True
+                yield chain, data
+
+        self.progress = (len(dataPageIds), len(dataPageIds))
+
+    def _iterDataPages(self, dataPageIds):
+        # Read the pages by batch so they can be decrypted in parallel
+        step = self.db.READ_AHEAD
+        for start in range(0, len(dataPageIds), step):
+            ids = dataPageIds[start:start+step]
+            yield from zip(ids, self.db.readDataPages(ids))
 
     def validate(self, db):
         debug_trace('TablePage.validate(%s)', self.page)
@@ -411,35 +694,80 @@ class TablePage:
             # TODO BITMAP pages
             pass
 
+    def extractColumns(self, table, names=None):
+        '''
+        Extract the given columns (all by default) of all the records of this table
+        (see Table.extractColumns()).
+        '''
+        return table.extractColumns(self, names)
+
     def getCount(self):
         self._initialize()
 
         return len(self.records)
 
     def __iter__(self):
-        self._initialize()
+        # The map is only built when it can be stored in the database index
+        return self.iterRecords(mapRecords=self.db.index is not None)
+
+    def iterRecords(self, mapRecords=False):
+        '''
+        Generate the content of the records. Unless the records are already mapped (see
+        getRecord()), they are read while walking the DATA pages, and the map is only built
+        (for the next getRecord() calls) if mapRecords is True.
+        '''
+        if self._loadRecordMap():
+            for i in range(len(self.records)):
+                self.progress = (i, len(self.records))
+                yield self.getRecord(i)
+            self.progress = (len(self.records), len(self.records))
+            return
+
+        records = [] if mapRecords else None
+        for chain, data in self._iterRecords():
+            if DEBUG_TRACE:
+                debug_trace('TablePage.__iter__(page=%s, chain=%s)', self.page, chain)
+                debug_trace.lastPage = self
 
-        for i in range(len(self.records)):
-            yield self.getRecord(i)
+            if records is not None:
+                records.append(chain)
+            yield data
+
+        if records is not None:
+            self.records = records
+            self.ready = True
+            self.db.setRecordMap(self.page.id, records)
 
     def getRecord(self, i):
-        debug_trace('TablePage.getRecord(page=%s, i=%s)', self.page, i)
-        debug_trace.lastPage = self
+        '''
+        Return the content of the i-th record: a memoryview of the DATA page if the record is
+        stored in a single entry, or a bytearray otherwise. The first call maps all the records
+        of the table to their DATA page entries.
+        '''
+        if DEBUG_TRACE:
+            debug_trace('TablePage.getRecord(page=%s, i=%s)', self.page, i)
+            debug_trace.lastPage = self
 
         self._initialize()
 
         record = self.records[i]
-        data = bytearray()
+        data = None
         for (id, idx) in record:
-            if not (self.lastDataPage is not None and self.lastDataPage.page.id == id):
-                self.lastDataPage = DataPage(self.db.readPage(id, validate=False))
-            entry = self.lastDataPage.getEntry(idx)[1]
-            if len(data) > 0:
+            # Other threads might change lastDataPage
+            dataPage = self.lastDataPage
+            if dataPage is None or dataPage.page.id != id:
+                dataPage = self.lastDataPage = self.db.readDataPage(id)
+            entry = dataPage.getEntry(idx)[1]
+            if data is None:
+                # Records stored in a single entry are not copied
+                data = entry
+            else:
+                if not isinstance(data, bytearray):
+                    data = bytearray(data)
                 # Remove the first 4 bytes when adding continuation entries
-                entry = entry[4:]
-            data += entry
+                data += entry[4:]
 
-        return data
+        return bytearray() if data is None else data
 
 class Table:
     '''
@@ -464,9 +792,15 @@ class Table:
         debug_trace.lastTable = self
 
         self._sortedColumns = []
+        self._decoders = {}  # colCount => RowDecoder
         self.sortColumns()
         self.needValidate = True
 
+        # Number of rows decoded by extractRow() and extractColumns() (see DataBase.getMetrics()).
+        # Rows can be decoded from several threads, so it is updated under a lock.
+        self.rowsDecoded = 0
+        self.rowsLock = threading.Lock()
+
     def __repr__(self):
         return 'Table<name=%s, pageId=%05x, columns=%s>' % (self.name,
                 0xFFFFF if self.pageId is None else self.pageId, self.columns)
@@ -474,6 +808,27 @@ class Table:
     def __str__(self):
         return repr(self)
 
+    def toDict(self):
+        '''
+        Return the table definition as a dict that can be serialized to JSON.
+        '''
+        return {
+            'name': self.name,
+            'pageId': self.pageId,
+            'nick': self.nick,
+            'trackingType': self.trackingType,
+            'ddlGranted': self.ddlGranted,
+            'readOnly': self.readOnly,
+            'compressed': self.compressed,
+            'columns': [column.toDict() for column in self.columns],
+        }
+
+    @classmethod
+    def fromDict(cls, state):
+        state = dict(state)
+        state['columns'] = [Column.fromDict(column) for column in state['columns']]
+        return cls(**state)
+
     def addColumn(self, column):
         debug_trace('Table.addColumn(name=%s, column=%s)', self.name, column)
         debug_trace.lastTable = self
@@ -558,138 +913,387 @@ class Table:
         self.bitfieldSize = math.ceil(minBitfieldSize / 8)
         self.minRowSize += self.bitfieldSize
 
-        self.needValidate = False
+        # Row keys by index/name, in column index order and in storage order
+        self._indexKeys = [col.index for col in self.columns]
+        self._nameKeys = [col.name for col in self.columns]
+        self._sortedIndexKeys = [(col.index, col.index) for col in self._sortedColumns]
+        self._sortedNameKeys = [(col.name, col.index) for col in self._sortedColumns]
 
-    def extractRow(self, data, sortByIndex=False, keyIndex=False):
-        debug_trace('Table.extractRow(name=%s, data=%s)', self.name, data)
-        debug_trace.lastTable = self
+        self._decoders = {}
+        self.needValidate = False
 
+    def getDecoder(self, colCount):
+        '''
+        Return the RowDecoder for the records of this table that store colCount columns.
+        '''
         if self.needValidate:
             self.validate()
 
+        decoder = self._decoders.get(colCount)
+        if decoder is None:
+            decoder = self._decoders[colCount] = RowDecoder(self, colCount)
+        return decoder
+
+    def extractRow(self, data, sortByIndex=False, keyIndex=False):
+        if DEBUG_TRACE:
+            debug_trace('Table.extractRow(name=%s, data=%s)', self.name, data)
+            debug_trace.lastTable = self
+
         if len(data) < 8:
             raise RuntimeError('rows size (%d) is too small for table %s record (>=%d)'
                     % (len(data), self.name, 8))
 
-        (nextChunk, colCount) = struct.unpack_from('<LL', data)
-        nextChunk = (nextChunk >> 12, nextChunk & 0xFFF)  # pageId, entry index
+        colCount = DWORD(data, 4)
+        decoder = self._decoders.get(colCount)
+        if decoder is None or self.needValidate:
+            if colCount > len(self.columns):
+                raise RuntimeError('number of columns (%d) is unexpected for table %s record (>=%d)'
+                        % (colCount, self.name, len(self.columns)))
+            decoder = self.getDecoder(colCount)
 
-        if colCount > len(self.columns):
-            raise RuntimeError('number of columns (%d) is unexpected for table %s record (>=%d)'
-                    % (colCount, self.name, len(self.columns)))
+        values = decoder.decode(data)
+        with self.rowsLock:
+            self.rowsDecoded += 1
 
-        if colCount == len(self.columns):
-            headerSize = self.headerSize
-            minRowSize = self.minRowSize
-            bitfieldSize = self.bitfieldSize
+        if sortByIndex:
+            keys = self._indexKeys if keyIndex else self._nameKeys
+            return dict(zip(keys, values))
 
-        else:
-            # The last columns are missing
-            # Re-compute the sizes
-            headerSize = 4 + 4 + math.ceil(colCount / 8)
-            minRowSize = headerSize
-
-            minBitfieldSize = 0
-            position = 0
-            storage = 0
-            for i, col in enumerate(self._sortedColumns):
-                if i >= colCount:
-                    break
+        # Same order as the storage
+        keys = self._sortedIndexKeys if keyIndex else self._sortedNameKeys
+        return {key: values[i] for (key, i) in keys}
+
+    def getColumn(self, name):
+        for col in self.columns:
+            if col.name == name:
+                return col
+        raise KeyError('no column %s in table %s' % (name, self.name))
+
+    def extractColumns(self, records, names=None):
+        '''
+        Extract the given columns (all by default) from the records, column by column.
+        Return a dict {name: values}, in column index order. Numeric columns are decoded in bulk
+        into arrays (NumPy arrays if available, array.array otherwise), bit columns into bool
+        arrays (or lists), and other columns into lists.
+        '''
+        debug_trace('Table.extractColumns(name=%s, names=%s)', self.name, names)
+        debug_trace.lastTable = self
+
+        if self.needValidate:
+            self.validate()
+
+        columns = self.columns if names is None else sorted(
+                [self.getColumn(name) for name in names], key=lambda c: c.index)
+        indexes = set(col.index for col in columns)
 
-                if storage != col.type.storage:
-                    storage = col.type.storage
-                    position = 0
+        # Records are grouped by number of stored columns (usually only 1 group)
+        groups = {}
+        count = 0
+        for data in records:
+            if data is None:
+                continue
+
+            if len(data) < 8:
+                raise RuntimeError('rows size (%d) is too small for table %s record (>=%d)'
+                        % (len(data), self.name, 8))
+            colCount = DWORD(data, 4)
+            if colCount > len(self.columns):
+                raise RuntimeError('number of columns (%d) is unexpected for table %s record (>=%d)'
+                        % (colCount, self.name, len(self.columns)))
+
+            group = groups.get(colCount)
+            if group is None:
+                group = groups[colCount] = ([], [])
+            group[0].append(count)
+            group[1].append(data)
+            count += 1
+
+        decoded = [(positions, self.getDecoder(colCount).decodeColumns(groupRecords, indexes))
+                for colCount, (positions, groupRecords) in groups.items()]
+        with self.rowsLock:
+            self.rowsDecoded += count
+
+        result = {}
+        for col in columns:
+            if len(decoded) == 1:
+                result[col.name] = decoded[0][1][col.index]
+                continue
 
-                if storage == 0:
-                    position += 1
-                    minBitfieldSize = position
-                elif storage == 1:
-                    position += col.size
-                    minRowSize += col.size
+            # Merge the groups back in records order
+            values = [None] * count
+            for (positions, groupColumns) in decoded:
+                for pos, value in zip(positions, groupColumns[col.index]):
+                    values[pos] = value
+            parts = [groupColumns[col.index] for (_, groupColumns) in decoded]
+            if numpy is not None and all(isinstance(part, numpy.ndarray) for part in parts):
+                values = numpy.array(values, dtype=numpy.result_type(*parts))
+            elif parts and all(isinstance(part, array.array) for part in parts):
+                values = array.array(parts[0].typecode, values)
+            result[col.name] = values
+
+        return result
+
+    def exportNpz(self, fpath, db, names=None):
+        '''
+        Export the given columns (all by default) of the table into a NumPy .npz file (one array
+        per column). LV data are extracted. Binary columns are stored as object arrays, so they
+        need allow_pickle=True to be loaded.
+        '''
+        if numpy is None:
+            raise RuntimeError('NumPy is required to export tables to .npz files')
+
+        columns = self.extractColumns(db.getTablePage(self), names)
+        arrays = {}
+        for name, values in columns.items():
+            if not isinstance(values, numpy.ndarray):
+                values = [v.extract(db) if isinstance(v, LvData) else v for v in values]
+                if all(isinstance(v, str) for v in values):
+                    values = numpy.array(values, dtype=str)
+                elif all(isinstance(v, datetime) for v in values):
+                    values = numpy.array(values, dtype='datetime64[ms]')
                 else:
-                    position += 1
-                    minRowSize += 2
+                    objects = numpy.empty(len(values), dtype=object)
+                    objects[:] = [bytes(v) if isinstance(v, (bytearray, memoryview)) else v
+                            for v in values]
+                    values = objects
+            arrays[name] = values
 
-            bitfieldSize = math.ceil(minBitfieldSize / 8)
-            minRowSize += bitfieldSize
+        numpy.savez(fpath, **arrays)
 
-        if len(data) < headerSize:
-            raise RuntimeError('rows size (%d) is too small for table %s record (>=%d)'
-                    % (len(data), self.name, headerSize))
+class RowDecoder:
+    '''
+    Decoding plan for the records of a table, compiled from the table schema for a given number
+    of stored columns (the last columns of a table might be missing from a record):
+        - the bits are extracted from the bitfield by position
+        - all the numeric columns are unpacked at once with a single struct.Struct
+        - other fixed-size columns and variable-size columns are parsed with Column.parse
+        - missing columns get their default value
+    The values are returned as a list in column index order.
+    '''
+    def __init__(self, table, colCount):
+        self.table = table
+        self.colCount = colCount
+        self.columnCount = len(table.columns)
+
+        # nextChunk + colCount + colMask
+        self.headerSize = 4 + 4 + math.ceil(colCount / 8)
+        self.minRowSize = self.headerSize
+
+        self.bits = []       # (index, position)
+        self.numeric = []    # (index, count)
+        self.layout = []     # (index, offset, code, value position) for the numeric columns
+        self.convert = []    # (index, function), applied after numeric unpack
+        self.slices = []     # (index, offset, size, parse)
+        self.variable = []   # (index, parse)
+        self.defaults = []   # (index, value)
+
+        fmt = '<'
+        minBitfieldSize = 0
+        fixedSize = 0
+        for i, col in enumerate(table._sortedColumns):
+            if i >= colCount:
+                # Column is missing, use default value
+                self.defaults.append((col.index, col.get_default()))
+                continue
+
+            storage = col.type.storage
+            if storage == 0:
+                self.bits.append((col.index, col.position))
+                minBitfieldSize = col.position + 1
+            elif storage == 1:
+                code = Column.STRUCT_CODES.get(col.type.value)
+                if code is not None and struct.calcsize('<' + code) <= col.size:
+                    self.layout.append((col.index, fixedSize, code,
+                            sum([count for (_, count) in self.numeric])))
+                    fmt += code
+                    padding = col.size - struct.calcsize('<' + code)
+                    if padding > 0:
+                        fmt += '%dx' % (padding,)
+                    if col.type.value == Column.TYPE_DATETIME.value:
+                        # Unpacked as (ticks, days)
+                        self.numeric.append((col.index, 2))
+                        self.convert.append((col.index, Column.parse_datetime))
+                    else:
+                        self.numeric.append((col.index, 1))
+                        if col.type.value == Column.TYPE_MONEY.value:
+                            self.convert.append((col.index, Column.parse_money))
+                else:
+                    self.slices.append((col.index, fixedSize, col.size, col.getParser()))
+                    fmt += '%dx' % (col.size,)
+                fixedSize += col.size
+            else:
+                self.variable.append((col.index, col.getParser()))
+
+        self.bitfieldSize = math.ceil(minBitfieldSize / 8)
+        self.fixedOffset = self.headerSize + self.bitfieldSize
+        self.fixedStruct = struct.Struct(fmt)
+        self.fixedSize = fixedSize
+        self.varmapOffset = self.fixedOffset + fixedSize
+        self.varmapStruct = struct.Struct('<%dH' % (len(self.variable),))
+        self.minRowSize = self.varmapOffset + self.varmapStruct.size
+
+    def __repr__(self):
+        return 'RowDecoder<table=%s, colCount=%d>' % (self.table.name, self.colCount)
 
-        colMaskBytes = data[8:headerSize]
-        colMask = 0
-        while len(colMaskBytes) > 0:
-            # Invert it so 1=present and 0=missing
-            colMask = (colMask << 8) | (colMaskBytes.pop() ^ 0xFF)
-        # Columns marked as "missing" are actually present, but their value should be default?
+    def __str__(self):
+        return repr(self)
 
-        if len(data) < minRowSize:
+    def decode(self, data):
+        if len(data) < self.minRowSize:
             # FIXME What about compressed rows/columns/tables?
             raise RuntimeError('rows size (%d) is too small for table %s record (>=%d)'
-                    % (len(data), self.name, minRowSize))
+                    % (len(data), self.table.name,
+                       self.headerSize if len(data) < self.headerSize else self.minRowSize))
+        # Columns marked as "missing" in the column mask (after the header) are actually present,
+        # but their value should be default?
+
+        values = [None] * self.columnCount
+
+        if self.bits:
+            bitfield = int.from_bytes(data[self.headerSize:self.fixedOffset], 'little')
+            for (index, position) in self.bits:
+                values[index] = ((bitfield >> position) & 1) != 0
+
+        fixed = self.fixedStruct.unpack_from(data, self.fixedOffset)
+        n = 0
+        for (index, count) in self.numeric:
+            if count == 1:
+                values[index] = fixed[n]
+            else:
+                values[index] = fixed[n:n+count]
+            n += count
+        for (index, function) in self.convert:
+            values[index] = function(values[index])
 
-        pos = headerSize
+        pos = self.fixedOffset
+        for (index, offset, size, parse) in self.slices:
+            values[index] = parse(data[pos+offset:pos+offset+size])
 
-        bitfield = 0
-        if bitfieldSize > 0:
-            for n in range(bitfieldSize):
-                bitfield |= BYTE(data, pos) << (n * 8)
-                pos += 1
+        if self.variable:
+            for (index, value) in self.decodeVariable(data):
+                values[index] = value
 
-        binData = data[minRowSize:]
+        for (index, value) in self.defaults:
+            values[index] = value
 
-        row = {}
-        for i, col in enumerate(self._sortedColumns):
-            if i >= colCount:
-                # Column is missing, use default value
-                row[col.index if keyIndex else col.name] = col.get_default()
+        return values
+
+    def decodeVariable(self, data, indexes=None):
+        '''
+        Return the list of (index, value) of the variable-size columns of the record (only
+        the ones whose index is in indexes if given).
+        '''
+        result = []
+        binData = data[self.minRowSize:]
+        binSize = len(binData)
+        varmap = self.varmapStruct.unpack_from(data, self.varmapOffset)
+        last = len(varmap) - 1
+        for n, (index, parse) in enumerate(self.variable):
+            if indexes is not None and index not in indexes:
                 continue
 
-            if col.type.storage == 0:
-                debug_trace('parseBit(col=%s)', col)
-                row[col.index if keyIndex else col.name] = True if ((bitfield >> col.position) & 1) != 0 else False
-            elif col.type.storage == 1:
-                colData = data[pos:pos+col.size]
-                pos += col.size
-                row[col.index if keyIndex else col.name] = col.parse(colData)
+            start = varmap[n]
+            ascii = (start & 0x8000) != 0
+            start &= 0x7FFF
+            if n < last:
+                end = varmap[n + 1] & 0x7FFF
+                if end > binSize:
+                    end = binSize
             else:
-                if col.position == 0:
-                    debug_trace('varmap=%s', data[pos:minRowSize])
-
-                start = WORD(data, pos)
-                ascii = (start & 0x8000) != 0
-                start &= 0x7FFF
-                pos += 2
-                if pos < minRowSize:
-                    end = WORD(data, pos) & 0x7FFF
-                    if end > len(binData):
-                        end = len(binData)
-                else:
-                    end = len(binData)
+                end = binSize
 
-                if start < end:
-                    # Field is present
-                    if start > len(binData):
-                        raise RuntimeError('start (%d) is too big for table %s record (<=%d)'
-                                % (start, self.name, len(binData)))
+            if start < end:
+                # Field is present
+                if start > binSize:
+                    raise RuntimeError('start (%d) is too big for table %s record (<=%d)'
+                            % (start, self.table.name, binSize))
 
-                    colData = binData[start:end]
-                else:
-                    # Empty
-                    colData = b''
+                colData = binData[start:end]
+            else:
+                # Empty
+                colData = b''
 
-                row[col.index if keyIndex else col.name] = col.parse(colData, ascii=ascii)
+            result.append((index, parse(colData, ascii=ascii)))
 
-        if sortByIndex:
-            # TODO Return a list instead?
-            _row = {}
-            for col in self.columns:
-                key = col.index if keyIndex else col.name
-                _row[key] = row[key]
-            row = _row
+        return result
+
+    def decodeColumns(self, records, indexes):
+        '''
+        Decode the columns whose index is in indexes from all the records at once.
+        Return a dict {index: values}, where values is an array for numeric columns (NumPy
+        array if available, array.array otherwise) or a list.
+        '''
+        for data in records:
+            if len(data) < self.minRowSize:
+                raise RuntimeError('rows size (%d) is too small for table %s record (>=%d)'
+                        % (len(data), self.table.name, self.minRowSize))
+
+        columns = {}
+        count = len(records)
+
+        for (index, value) in self.defaults:
+            if index in indexes:
+                columns[index] = [value] * count
+
+        bits = [(index, position) for (index, position) in self.bits if index in indexes]
+        if bits:
+            bitfields = [int.from_bytes(data[self.headerSize:self.fixedOffset], 'little')
+                    for data in records]
+            for (index, position) in bits:
+                values = [((bitfield >> position) & 1) != 0 for bitfield in bitfields]
+                columns[index] = values if numpy is None else numpy.array(values, dtype=bool)
+
+        layout = [(n, index, offset, code) for (index, offset, code, n) in self.layout
+                if index in indexes]
+        if layout:
+            # Bulk decode the fixed-size area of all the records
+            fixed = b''.join([data[self.fixedOffset:self.varmapOffset] for data in records])
+            if numpy is not None:
+                dtype = numpy.dtype({
+                    'names': ['c%d' % (index,) for (_, index, _, _) in layout],
+                    'formats': [NUMPY_CODES[code] for (_, _, _, code) in layout],
+                    'offsets': [offset for (_, _, offset, _) in layout],
+                    'itemsize': self.fixedSize,
+                })
+                rows = numpy.frombuffer(fixed, dtype=dtype, count=count)
+                for (_, index, _, code) in layout:
+                    columns[index] = rows['c%d' % (index,)].copy()
+            else:
+                rows = list(zip(*self.fixedStruct.iter_unpack(fixed)))
+                for (n, index, _, code) in layout:
+                    if code not in ARRAY_CODES:
+                        # DATETIME is unpacked as (ticks, days)
+                        columns[index] = list(zip(rows[n], rows[n+1])) if count > 0 else []
+                    else:
+                        columns[index] = array.array(ARRAY_CODES[code], rows[n] if count > 0 else [])
 
-        return row
+            for (index, function) in self.convert:
+                if index not in columns:
+                    continue
+                if function is Column.parse_money:
+                    values = columns[index]
+                    columns[index] = (values / 10000 if numpy is not None
+                            else array.array('d', [v / 10000 for v in values]))
+                else:
+                    values = columns[index]
+                    if numpy is not None:
+                        values = [tuple(v) for v in values.tolist()]
+                    columns[index] = [function(v) for v in values]
+
+        pos = self.fixedOffset
+        for (index, offset, size, parse) in self.slices:
+            if index in indexes:
+                columns[index] = [parse(data[pos+offset:pos+offset+size]) for data in records]
+
+        variable = set(index for (index, _) in self.variable if index in indexes)
+        if variable:
+            for index in variable:
+                columns[index] = []
+            for data in records:
+                for (index, value) in self.decodeVariable(data, variable):
+                    columns[index].append(value)
+
+        return columns
 
 class Column:
     '''
@@ -746,8 +1350,27 @@ class Column:
 
     TYPES = {}
 
+    # struct codes of the numeric types that can be unpacked directly
+    STRUCT_CODES = {
+        TYPE_TINYINT.value:     'B',
+        TYPE_SMALLINT.value:    'h',
+        TYPE_USHORT.value:      'H',
+        TYPE_INTEGER.value:     'l',
+        TYPE_ULONG.value:       'L',
+        TYPE_BIGINT.value:      'q',
+        TYPE_UBIGINT.value:     'Q',
+        TYPE_DATETIME.value:    'll',  # See parse_datetime()
+        TYPE_REAL.value:        'f',
+        TYPE_FLOAT.value:       'd',
+        TYPE_MONEY.value:       'q',  # See parse_money()
+        TYPE_ROWVERSION.value:  'Q',
+    }
+
     DATETIME_REF = datetime.fromisoformat('1900-01-01')
 
+    __slots__ = ('index', 'name', 'type', 'size', 'precision', 'scale', 'fixed', 'nullable',
+            'writeable', 'autoType', 'position', 'default', 'compressed', 'decWarned')
+
     def __init__(self, index, position, name, type, size=None, precision=None, scale=None,
             fixed=True, nullable=True, writeable=True, autoType=None, default=None,
             compressed=False):
@@ -771,124 +1394,140 @@ class Column:
         return 'Column<index=%s, name=%s, type=%s, size=%s, position=%s, default=%s>' % (self.index,
                 self.name, self.type, self.size, self.position, self.default)
 
+    def toDict(self):
+        '''
+        Return the column definition as a dict that can be serialized to JSON.
+        '''
+        return {
+            'index': self.index,
+            'position': self.position,
+            'name': self.name,
+            'type': self.type.value,
+            'size': self.size,
+            'precision': self.precision,
+            'scale': self.scale,
+            'fixed': self.fixed,
+            'nullable': self.nullable,
+            'writeable': self.writeable,
+            'autoType': self.autoType,
+            'default': self.default,
+            'compressed': self.compressed,
+        }
+
+    @classmethod
+    def fromDict(cls, state):
+        state = dict(state)
+        state['type'] = cls.TYPES[state['type']]
+        return cls(**state)
+
     def parse(self, data, ascii=False):
-        debug_trace('Column.parse(self=%s, data=%s, ascii=%s)', self, data, ascii)
+        if DEBUG_TRACE:
+            debug_trace('Column.parse(self=%s, data=%s, ascii=%s)', self, data, ascii)
 
-        def clean_string(str):
-            # Remove extra characters after the first NUL character
-            return str.split('\0', 1)[0]
+        return self.getParser()(data, ascii)
 
-        # TODO Use a lookup table instead of a big if/elif bloc?
-        if self.type.value == self.TYPE_TINYINT.value:
-            return BYTE(data)
-        elif self.type.value == self.TYPE_SMALLINT.value:
-            return struct.unpack_from('<h', data)[0]
-        elif self.type.value == self.TYPE_USHORT.value:
-            return WORD(data)
-        elif self.type.value == self.TYPE_INTEGER.value:
-            return struct.unpack_from('<l', data)[0]
-        elif self.type.value == self.TYPE_ULONG.value:
-            return DWORD(data)
-        elif self.type.value == self.TYPE_BIGINT.value:
-            return struct.unpack_from('<q', data)[0]
-        elif self.type.value == self.TYPE_UBIGINT.value:
-            return QWORD(data)
-        elif self.type.value == self.TYPE_BINARY.value:
-            return data
-        elif self.type.value == self.TYPE_DATETIME.value:
-            # 300 ticks per second
-            ticks, days = struct.unpack_from('<ll', data)
-            dt = self.DATETIME_REF + timedelta(days=days, milliseconds=ticks * 1000 / 300)
-            return dt
-        elif self.type.value == self.TYPE_UNIQUEIDENTIFIER.value:
-            return data
-        elif self.type.value == self.TYPE_REAL.value:
-            return struct.unpack_from('<f', data)[0]
-        elif self.type.value == self.TYPE_FLOAT.value:
-            return struct.unpack_from('<d', data)[0]
-        elif self.type.value == self.TYPE_MONEY.value:
-            return struct.unpack_from('<q', data)[0] / 10000
-        elif self.type.value == self.TYPE_NUMERIC.value:
-            # FIXME Support NUMERIC type?
-            if not self.decWarned:
-                print_err('Warning: no support for numeric(p, s) in column %s' % (self.name,))
-                self.decWarned = True
-            return 0
-        elif self.type.value == self.TYPE_ROWVERSION.value:
-            return QWORD(data)
-        elif self.type.value == self.TYPE_NCHAR.value:
-            # XXX CP-1252 is a guess, we should probably infer the code page from LCID in DB header
-            return clean_string(data.decode('cp1252' if ascii else 'utf-16'))
-        elif self.type.value == self.TYPE_NVARCHAR.value:
-            # XXX CP-1252 is a guess, we should probably infer the code page from LCID in DB header
-            return clean_string(data.decode('cp1252' if ascii else 'utf-16'))
-        elif self.type.value == self.TYPE_VARBINARY.value:
-            return data
-        elif self.type.value == self.TYPE_IMAGE.value or self.type.value == self.TYPE_NTEXT.value:
-            if self.type.value == self.TYPE_NTEXT.value:
-                # XXX CP-1252 is a guess, we should probably infer the code page from LCID in DB header
-                encoding = 'cp1252' if ascii else 'utf-16'
-            else:
-                encoding = None
+    def getParser(self):
+        '''
+        Return the function (data, ascii=False) that parses the values of this column.
+        '''
+        parser = self.PARSERS.get(self.type.value)
+        if parser is None:
+            raise RuntimeError('unknown NumType %d' % (self.type.value,))
+        return types.MethodType(parser, self)
 
-            if len(data) == 0:
-                return b'' if encoding is None else ''
+    def _parse_string(self, data, ascii=False):
+        # XXX CP-1252 is a guess, we should probably infer the code page from LCID in DB header
+        return clean_string(str(data, 'cp1252' if ascii else 'utf-16'))
 
-            size = QWORD(data)
-            if size > 256-8:  # FIXME Might be wrong
-                # Stored in LV page(s)
-                pageCount = math.ceil(size / (4096 - 16))
-                wordCount = math.ceil(pageCount / 3)
-                if wordCount > (256 - 8) / 8:  # FIXME Might be wrong
-                    # Stored in LV page(s) whose list is given in LVMAP page(s)
-
-                    # FIXME There might be multiple levels of LVMAP to reach the max size
-                    #       of 1073741823 bytes?
-                    #       Max size for  1 LVMAP is   6230160 bytes
-                    #       Max size for 31 LVMAP is 193134960 bytes
-                    #       Max size for 31 LVMAP pointing to LVMAP is 294917083920 bytes
-
-                    lvmapCount = math.ceil(pageCount / ((4096 - 16 - 8) / 8 * 3))
-                    lvmapWordCount = math.ceil(lvmapCount / 3)
-                    if len(data) != 8 + lvmapWordCount * 8:
-                        raise RuntimeError('unexpected LVMAP data size (%d vs %d) for column %s'
-                                % (len(data), 8 + lvmapWordCount * 8, self.name))
-                    lvmapPageIds = []
-                    for n in range(lvmapWordCount):
-                        word = QWORD(data, 8 + n * 8)
-                        for _ in range(3):
-                            if len(lvmapPageIds) == lvmapCount:
-                                break
-                            lvmapPageIds.append(word & 0xFFFFF)
-                            word >>= 20
-                    debug_trace('lvmapCount=%s, lvmapWordCount=%s, lvmapPageIds=%s',
-                            lvmapCount, lvmapWordCount, lvmapPageIds)
-                    return LvMapData(lvmapPageIds, size, encoding)
+    def _parse_bytes(self, data, ascii=False):
+        if isinstance(data, memoryview):
+            # Do not return a view of the record
+            data = bytearray(data)
+        return data
+
+    def _parse_numeric(self, data, ascii=False):
+        # FIXME Support NUMERIC type?
+        if not self.decWarned:
+            print_err('Warning: no support for numeric(p, s) in column %s' % (self.name,))
+            self.decWarned = True
+        return 0
+
+    def _parse_long(self, data, ascii=False):
+        if self.type.value == self.TYPE_NTEXT.value:
+            # XXX CP-1252 is a guess, we should probably infer the code page from LCID in DB header
+            encoding = 'cp1252' if ascii else 'utf-16'
+        else:
+            encoding = None
+
+        if len(data) == 0:
+            return b'' if encoding is None else ''
+
+        size = QWORD(data)
+        if size > 256-8:  # FIXME Might be wrong
+            # Stored in LV page(s)
+            pageCount = math.ceil(size / (4096 - 16))
+            wordCount = math.ceil(pageCount / 3)
+            if wordCount > (256 - 8) / 8:  # FIXME Might be wrong
+                # Stored in LV page(s) whose list is given in LVMAP page(s)
+
+                # FIXME There might be multiple levels of LVMAP to reach the max size
+                #       of 1073741823 bytes?
+                #       Max size for  1 LVMAP is   6230160 bytes
+                #       Max size for 31 LVMAP is 193134960 bytes
+                #       Max size for 31 LVMAP pointing to LVMAP is 294917083920 bytes
+
+                lvmapCount = math.ceil(pageCount / ((4096 - 16 - 8) / 8 * 3))
+                lvmapWordCount = math.ceil(lvmapCount / 3)
+                if len(data) != 8 + lvmapWordCount * 8:
+                    raise RuntimeError('unexpected LVMAP data size (%d vs %d) for column %s'
+                            % (len(data), 8 + lvmapWordCount * 8, self.name))
+                lvmapPageIds = []
+                for n in range(lvmapWordCount):
+                    word = QWORD(data, 8 + n * 8)
+                    for _ in range(3):
+                        if len(lvmapPageIds) == lvmapCount:
+                            break
+                        lvmapPageIds.append(word & 0xFFFFF)
+                        word >>= 20
+                debug_trace('lvmapCount=%s, lvmapWordCount=%s, lvmapPageIds=%s',
+                        lvmapCount, lvmapWordCount, lvmapPageIds)
+                return LvMapData(lvmapPageIds, size, encoding)
 
-                else:
-                    if len(data) != 8 + wordCount * 8:
-                        raise RuntimeError('unexpected data size (%d vs %d) for column %s'
-                                % (len(data), 8 + wordCount * 8, self.name))
-                    pageIds = []
-                    for n in range(wordCount):
-                        word = QWORD(data, 8 + n * 8)
-                        for _ in range(3):
-                            if len(pageIds) == pageCount:
-                                break
-                            pageIds.append(word & 0xFFFFF)
-                            word >>= 20
-                    return LvData(pageIds, size, encoding)
             else:
-                # Stored in this page
-                if len(data) != size + 8:
+                if len(data) != 8 + wordCount * 8:
                     raise RuntimeError('unexpected data size (%d vs %d) for column %s'
-                            % (len(data), size + 8, self.name))
-                data = data[8:]
-                if encoding is not None:
-                    data = clean_string(data.decode(encoding))
-            return data
+                            % (len(data), 8 + wordCount * 8, self.name))
+                pageIds = []
+                for n in range(wordCount):
+                    word = QWORD(data, 8 + n * 8)
+                    for _ in range(3):
+                        if len(pageIds) == pageCount:
+                            break
+                        pageIds.append(word & 0xFFFFF)
+                        word >>= 20
+                return LvData(pageIds, size, encoding)
         else:
-            raise RuntimeError('unknown NumType %d' % (self.type.value,))
+            # Stored in this page
+            if len(data) != size + 8:
+                raise RuntimeError('unexpected data size (%d vs %d) for column %s'
+                        % (len(data), size + 8, self.name))
+            data = data[8:]
+            if encoding is not None:
+                data = clean_string(str(data, encoding))
+            else:
+                # Do not return a view of the record
+                data = bytearray(data)
+        return data
+
+    @classmethod
+    def parse_datetime(cls, value):
+        # 300 ticks per second
+        ticks, days = value
+        return cls.DATETIME_REF + timedelta(days=days, milliseconds=ticks * 1000 / 300)
+
+    @staticmethod
+    def parse_money(value):
+        return value / 10000
 
     def get_default(self):
         debug_trace('Column.get_default(self=%s)', self)
@@ -949,6 +1588,37 @@ for name in dir(Column):
     t = getattr(Column, name)
     Column.TYPES[t.value] = t
 
+def _struct_parser(fmt, convert=None):
+    unpack_from = struct.Struct(fmt).unpack_from
+    if convert is None:
+        return lambda self, data, ascii=False: unpack_from(data)[0]
+    return lambda self, data, ascii=False: convert(unpack_from(data)[0])
+
+# Parse function for each type (see Column.getParser())
+Column.PARSERS = {
+    Column.TYPE_TINYINT.value:          _struct_parser('<B'),
+    Column.TYPE_SMALLINT.value:         _struct_parser('<h'),
+    Column.TYPE_USHORT.value:           _struct_parser('<H'),
+    Column.TYPE_INTEGER.value:          _struct_parser('<l'),
+    Column.TYPE_ULONG.value:            _struct_parser('<L'),
+    Column.TYPE_BIGINT.value:           _struct_parser('<q'),
+    Column.TYPE_UBIGINT.value:          _struct_parser('<Q'),
+    Column.TYPE_BINARY.value:           Column._parse_bytes,
+    Column.TYPE_DATETIME.value:         lambda self, data, ascii=False:
+                                            self.parse_datetime(struct.unpack_from('<ll', data)),
+    Column.TYPE_UNIQUEIDENTIFIER.value: Column._parse_bytes,
+    Column.TYPE_REAL.value:             _struct_parser('<f'),
+    Column.TYPE_FLOAT.value:            _struct_parser('<d'),
+    Column.TYPE_MONEY.value:            _struct_parser('<q', Column.parse_money),
+    Column.TYPE_NUMERIC.value:          Column._parse_numeric,
+    Column.TYPE_ROWVERSION.value:       _struct_parser('<Q'),
+    Column.TYPE_NCHAR.value:            Column._parse_string,
+    Column.TYPE_NVARCHAR.value:         Column._parse_string,
+    Column.TYPE_VARBINARY.value:        Column._parse_bytes,
+    Column.TYPE_IMAGE.value:            Column._parse_long,
+    Column.TYPE_NTEXT.value:            Column._parse_long,
+}
+
 class BitmapPage:
     '''
     A BITMAP page indicates which page is of interest within a range of pages through a big bits map.
@@ -978,6 +1648,8 @@ class BitmapPage:
         self.firstPageId = WORD(page.data, 16+2)
         self.lastPageId = WORD(page.data, 16+4)
 
+        self.pageIds = None  # See getPageIds()
+
     def __repr__(self):
         return 'BitmapPage<page=%s>' % (self.page)
 
@@ -985,13 +1657,53 @@ class BitmapPage:
         return repr(self)
 
     def __iter__(self):
-        if self.pageCount == 0:
-            return
+        ids = self.getPageIds()
+        yield from (ids.tolist() if numpy is not None else ids)
+
+    def getPageIds(self):
+        '''
+        Return the array of the page IDs (relative to the BITMAP page range) included in this
+        BITMAP page, in increasing order.
+        '''
+        if self.pageIds is None:
+            self.pageIds = self._decode()
+        return self.pageIds
 
-        id = 0
-        while id != self.lastPageId:
-            id = self.getNext(id)
-            yield id
+    def _decode(self):
+        debug_trace('BitmapPage._decode(%s)', self.page)
+        debug_trace.lastPage = self
+
+        if self.pageCount == 0:
+            return numpy.zeros(0, dtype=numpy.uint32) if numpy is not None else array.array('I')
+
+        # Includes firstPageId, then the pages whose bit is set up to lastPageId
+        first = self.firstPageId
+        last = self.lastPageId
+        if numpy is not None:
+            bits = numpy.unpackbits(numpy.frombuffer(self.page.data, dtype=numpy.uint8, offset=32),
+                    bitorder='little')
+            ids = numpy.flatnonzero(bits[first+1:last+1]).astype(numpy.uint32)
+            ids += first + 1
+            if first != 0:
+                ids = numpy.concatenate((numpy.array([first], dtype=numpy.uint32), ids))
+            return ids
+
+        ids = array.array('I')
+        if first != 0:
+            ids.append(first)
+        base = 0
+        for (word,) in struct.iter_unpack('<Q', self.page.data[32:]):
+            while word != 0:
+                lowBit = word & -word
+                id = base + lowBit.bit_length() - 1
+                word ^= lowBit
+                if id <= first:
+                    continue
+                if id > last:
+                    return ids
+                ids.append(id)
+            base += 64
+        return ids
 
     def getNext(self, id):
         debug_trace('BitmapPage.getNext(%s, %d)', self.page, id)
@@ -1004,22 +1716,12 @@ class BitmapPage:
         if self.pageCount == 0:
             return None
 
-        id += 1
-        pos = 32 + id // 8
-        bit_mask = 1 << (id & 0x7)
-        while pos < len(self.page.data):
-            # TODO Optimizations (skip the next 1/2/4/8-bytes word if 0)
-            if (self.page.data[pos] & bit_mask) != 0:
-                return id
-            id += 1
-            if bit_mask == 0x80:
-                bit_mask = 1
-                pos += 1
-            else:
-                bit_mask <<=1
-
-        # Should not happen as we should end on self.lastPageId in the worse case
-        raise RuntimeError('cannot find next page ID')
+        ids = self.getPageIds()
+        n = bisect.bisect_right(ids, id)
+        if n == len(ids):
+            # Should not happen as we should end on self.lastPageId in the worse case
+            raise RuntimeError('cannot find next page ID')
+        return int(ids[n])
 
 class ObjectType:
     TABLE       = 1
@@ -1079,6 +1781,8 @@ class LvData:
     This class represents a Long Value data that is stored in LV pages. The data is only extracted
     on demand.
     '''
+    __slots__ = ('pageIds', 'size', 'encoding')
+
     def __init__(self, pageIds, size, encoding=None):
         self.pageIds = pageIds
         self.size = size
@@ -1086,13 +1790,36 @@ class LvData:
 
     def extract(self, db):
         data = bytearray()
-        size = self.size
-        if len(self.pageIds) * (4096 - 16) < size:
+        for chunk in self.iterChunks(db):
+            data += chunk
+
+        return data if self.encoding is None else data.decode(self.encoding)
+
+    def extractTo(self, db, fh):
+        '''
+        Write the raw data (not decoded, even if the data has an encoding) to the file object fh,
+        one page at a time. Return the number of bytes written.
+        '''
+        size = 0
+        for chunk in self.iterChunks(db):
+            fh.write(chunk)
+            size += len(chunk)
+        return size
+
+    def iterChunks(self, db):
+        '''
+        Generate the raw data (not decoded, even if the data has an encoding) stored in each LV
+        page, without keeping the previous pages in memory.
+        '''
+        pageIds = self.getPageIds(db)
+        size = self.size
+        if len(pageIds) * (4096 - 16) < size:
             raise RuntimeError('not enough LV pages (%d) for storing %d bytes'
-                    % (len(self.pageIds), self.size))
+                    % (len(pageIds), self.size))
 
-        for pageId in self.pageIds:
-            page = db.readPage(pageId)
+        for pageId, page in self._iterPages(db, pageIds):
+            if size == 0:
+                break
             if page is None:
                 raise RuntimeError('cannot read page %05x' % (pageId,))
             if page.type != PageType.LV:
@@ -1101,25 +1828,36 @@ class LvData:
             chunk_size = 4096 - 16
             if chunk_size > size:
                 chunk_size = size
-            data += page.data[16:16+chunk_size]
+            db.metrics.addLvBytes(chunk_size)
+            yield memoryview(page.data)[16:16+chunk_size]
             size -= chunk_size
 
         if size != 0:
             raise RuntimeError('not enough LV pages (%d) for storing %d bytes'
-                    % (len(self.pageIds), self.size))
+                    % (len(pageIds), self.size))
 
-        return data if self.encoding is None else data.decode(self.encoding)
+    def getPageIds(self, db):
+        return self.pageIds
+
+    def _iterPages(self, db, pageIds):
+        # Read the pages by batch so they can be decrypted in parallel
+        step = db.READ_AHEAD
+        for start in range(0, len(pageIds), step):
+            ids = pageIds[start:start+step]
+            yield from zip(ids, db.readPages(ids))
 
 class LvMapData(LvData):
     '''
     This class represents a Long Value data that is stored in LVMAP pages (which store a list of
     LV pages). The data is only extracted on demand.
     '''
+    __slots__ = ('lvmapPageIds',)
+
     def __init__(self, lvmapPageIds, size, encoding=None):
         super().__init__([], size, encoding)
         self.lvmapPageIds = lvmapPageIds
 
-    def extract(self, db):
+    def getPageIds(self, db):
         if len(self.pageIds) == 0:
             # Extract the page IDs from the LVMAP pages
             for lvmapPageId in self.lvmapPageIds:
@@ -1143,30 +1881,314 @@ class LvMapData(LvData):
                         word >>= 20
             debug_trace('self.pageIds=%s', len(self.pageIds))
 
-        return super().extract(db)
+        return self.pageIds
+
+class PageCache:
+    '''
+    LRU cache of decoded pages, bounded by a number of pages and/or a number of bytes.
+    Pages whose type is in pinnedTypes are kept aside and are never evicted.
+    It can be used from several threads.
+    '''
+    def __init__(self, maxPages=100, maxBytes=None, pinnedTypes=()):
+        self.maxPages = maxPages
+        self.maxBytes = maxBytes
+        self.pinnedTypes = frozenset(pinnedTypes)
+        self.lock = threading.Lock()
+
+        self.pages = OrderedDict()
+        self.pinned = {}
+        self.size = 0  # In bytes, for non-pinned pages only
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return 'PageCache<pages=%d, pinned=%d, bytes=%d, hits=%d, misses=%d, evictions=%d>' % (
+                len(self.pages), len(self.pinned), self.size, self.hits, self.misses,
+                self.evictions)
+
+    def __str__(self):
+        return repr(self)
+
+    def __len__(self):
+        return len(self.pages) + len(self.pinned)
+
+    def __contains__(self, id):
+        return id in self.pages or id in self.pinned
+
+    def get(self, id):
+        with self.lock:
+            page = self.pinned.get(id)
+            if page is not None:
+                self.hits += 1
+                return page
+
+            page = self.pages.get(id)
+            if page is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.pages.move_to_end(id)
+            return page
+
+    def put(self, id, page):
+        with self.lock:
+            if page.type in self.pinnedTypes:
+                self.pinned[id] = page
+                return
+
+            old = self.pages.pop(id, None)
+            if old is not None:
+                self.size -= len(old.data)
+            self.pages[id] = page
+            self.size += len(page.data)
+
+            while len(self.pages) > 0 and self._isFull():
+                # Remove oldest cached page
+                _, old = self.pages.popitem(last=False)
+                self.size -= len(old.data)
+                self.evictions += 1
+
+    def _isFull(self):
+        if self.maxPages is not None and len(self.pages) > self.maxPages:
+            return True
+        if self.maxBytes is not None and self.size > self.maxBytes:
+            return True
+        return False
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+            self.pinned.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            'pages': len(self.pages),
+            'pinned': len(self.pinned),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+class Metrics:
+    '''
+    Counters of the work done by a DataBase (see DataBase.getMetrics()). The database can be
+    used from several threads, so the counters are updated under a lock.
+    '''
+    def __init__(self):
+        self.pagesRead = defaultdict(int)  # page type => count
+        self.reads = 0  # Number of reads from the file
+        self.bytesRead = 0
+        self.decryptCalls = 0
+        self.decryptTime = 0.0
+        self.checksumCalls = 0
+        self.checksumTime = 0.0
+        self.lvBytes = 0
+        self.lock = threading.Lock()
+
+    def addRead(self, size):
+        with self.lock:
+            self.reads += 1
+            self.bytesRead += size
+
+    def addPage(self, pageType):
+        with self.lock:
+            self.pagesRead[pageType] += 1
+
+    def addLvBytes(self, size):
+        with self.lock:
+            self.lvBytes += size
+
+    def addDecrypt(self, elapsed):
+        with self.lock:
+            self.decryptCalls += 1
+            self.decryptTime += elapsed
+
+    def addChecksum(self, elapsed):
+        with self.lock:
+            self.checksumCalls += 1
+            self.checksumTime += elapsed
+
+class GroupIndex:
+    '''
+    Index of the records of a table grouped by the values of one column, to find the rows of
+    one group (e.g. the actions of one room) without decoding the whole table again.
+
+    values are the values of the column for all the records of tablePage (see
+    TablePage.extractColumns()). They are extracted if not given.
+    '''
+    def __init__(self, db, table, column, tablePage=None, values=None):
+        debug_trace('GroupIndex(table=%s, column=%s)', table.name, column.name)
+        debug_trace.lastTable = table
+
+        self.table = table
+        self.column = column
+        self.tablePage = db.getTablePage(table) if tablePage is None else tablePage
+
+        if values is None:
+            values = self.tablePage.extractColumns(table, [column.name])[column.name]
+        values = values.tolist() if hasattr(values, 'tolist') else list(values)
+
+        groups = {}
+        for pos, value in enumerate(values):
+            if isinstance(value, LvData):
+                value = value.extract(db)
+            if value is None:
+                # NULL values are not grouped
+                continue
+            value = self.makeKey(value)
+            group = groups.get(value)
+            if group is None:
+                groups[value] = [pos]
+            else:
+                group.append(pos)
+        # Groups are returned to the callers, they must not be changed
+        self.groups = {value: tuple(group) for value, group in groups.items()}
+
+    @staticmethod
+    def makeKey(value):
+        '''Return the group key of a value (binary values are bytearray, not hashable).'''
+        if isinstance(value, (bytearray, memoryview)):
+            return bytes(value)
+        return value
+
+    def __len__(self):
+        return len(self.groups)
+
+    def getGroups(self):
+        '''
+        Return a dict {value: positions} of the records grouped by value (see makeKey()).
+        '''
+        return self.groups
+
+    def find(self, value):
+        '''
+        Return the positions (tuple) of the records (see TablePage.getRecord()) whose value is
+        value.
+        '''
+        return self.groups.get(self.makeKey(value), ())
 
 class DataBase:
+    SysObjects_Table = 1027
     SysObjects_BTree = 1028
 
-    def __init__(self, fpath, key=None, verify=False, _decrypt_only=False):
+    BACKEND_FILE = 'file'
+    BACKEND_MMAP = 'mmap'
+
+    # Number of pages read at once by readPages() callers
+    READ_AHEAD = 32
+
+    # Max number of pages read with a single read when their addresses are contiguous
+    READ_RUN_MAX = 256
+
+    # Sidecar index file (see __init__())
+    INDEX_SUFFIX = '.sdfidx'
+    INDEX_VERSION = 1
+
+    def __init__(self, fpath, key=None, verify=False, cache=None, backend=BACKEND_FILE,
+            workers=None, index=None, probe=None, _decrypt_only=False):
+        '''
+        If verify is False, DATA pages are only decrypted and validated when they are first
+        used. Otherwise, all of them are validated when opening the database, and all the
+        rows and LV data of all the tables are extracted to check their integrity.
+
+        cache is the PageCache instance to use for this database. By default, the last 100
+        pages read are cached.
+
+        backend selects how pages are read from the file:
+            BACKEND_FILE: each page is read with seek() + read()
+            BACKEND_MMAP: the file is memory-mapped and pages are memoryview slices of the
+                          mapping (no copy for unencrypted pages). Falls back to BACKEND_FILE
+                          if mmap is not available.
+
+        workers is the number of threads used to decrypt and validate pages in parallel
+        (AES decryption does not hold the GIL). Pages are processed in the calling thread if
+        it is None or 1.
+
+        The database can also be read from several threads (e.g. to extract several tables in
+        parallel): pages are read with os.pread() (or under a lock if it is not available) and
+        the caches are locked. Each TablePage iterator keeps its own state.
+
+        index is the path of a sidecar file used to store the structure of the database (page
+        map, tables definition and records of the tables), so it does not need to be rebuilt
+        the next time the same file is opened. If it is True, the file path with INDEX_SUFFIX
+        appended is used. The index is discarded if the version, size, modification time or
+        header of the file changed, and it is written when the database is closed. index can
+        also be the index of another DataBase instance of the same file (see _buildIndex()): it
+        is used as is (to share the structure of the database with other processes without
+        reading it again) and is not written.
+
+        probe is a FileProbe of the file (see probe_file()). Its file handle and header page
+        are used instead of opening and reading the file again, and its key is used if key is
+        None. The probe must not be used anymore after that.
+        '''
+        if probe is None:
+            probe = FileProbe(fpath)
+        if key is None:
+            key = probe.key
+
         self.fpath = fpath
+        self.index = None
+        if isinstance(index, dict):
+            self.index = index
+            index = None
+        self.indexPath = fpath + self.INDEX_SUFFIX if index is True else index
+        self.indexDirty = False
         self.key = key
 
         if self.key is not None:
-            if not check_key(self.fpath, self.key):
+            self.key_hash = probe.key_hash if self.key == probe.key else probe.checkKey(self.key)
+            if self.key_hash is None:
+                probe.close()
                 raise RuntimeError('bad key')
 
-            self.key_hash = hashes.Hash(hashes.SHA1())
-            self.key_hash.update(self.key)
+            self.keyCache = KeyCache(self.key_hash)
 
         self.pageToAddr = {0: 0}
         self.maxPageId = None
+        self.pageTypes = None
         self.tablePages = {}
-        self.pageCache = {}
-        self.pageCacheOrder = []
+        self.tables = {}
+        self.validDataPages = set()
+        self.groupIndexes = {}  # (table name, column name) => GroupIndex
+        self.metrics = Metrics()
+        self.pageCache = PageCache() if cache is None else cache
         self.pageCover = None
 
-        self.fh = open(fpath, 'rb')
+        self.fh = probe.detach()
+        self.fileLock = threading.Lock()  # Only used if os.pread() is not available
+        self.executor = None
+        self.mmap = None
+        self.view = None
+
+        try:
+            self._open(probe.header, verify, backend, workers, _decrypt_only)
+        except BaseException:
+            # Do not leak the file, the mapping and the threads if the file cannot be opened
+            self.indexDirty = False
+            self.close()
+            raise
+
+    def _open(self, header, verify, backend, workers, _decrypt_only):
+        '''
+        Read the structure of the database (see __init__()). header is the content of the
+        header page read by the probe.
+        '''
+        if workers is not None and workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        if backend == self.BACKEND_MMAP:
+            if mmap is None:
+                print_err('Warning: mmap is not available, using file backend')
+            elif os.fstat(self.fh.fileno()).st_size > 0:  # Empty files cannot be mapped
+                self.mmap = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+                self.view = memoryview(self.mmap)
+        elif backend != self.BACKEND_FILE:
+            raise ValueError('unknown backend %s' % (backend,))
 
         '''
         pageId 0: always at pageAddr 0
@@ -1200,7 +2222,12 @@ class DataBase:
              0x200   512    stats
         '''
 
-        self.header = self.readPage(0)
+        # The header page was already read by the probe
+        self.header = None
+        if len(header) == 4096:
+            self.metrics.addRead(len(header))
+            self.header = self._decodePage(0, 0, header)
+            self._addPage(0, self.header, True)
         if self.header is None:
             raise RuntimeError('cannot read page 0')
 
@@ -1208,7 +2235,7 @@ class DataBase:
             # Only decrypt the file and store it in a BIN file
             # (the result is probably not usable by SQL CE Server)
             pageToAddr = defaultdict(list)
-            out_fpath = fpath + '.bin'
+            out_fpath = self.fpath + '.bin'
             print('Writing decrypted file to "%s"...' % (out_fpath,))
             with open(out_fpath, 'wb') as out:
                 addr = 0
@@ -1222,7 +2249,7 @@ class DataBase:
                         pageToAddr[page.id].append(addr)
                     addr += 1
 
-            out_fpath = fpath + '.map'
+            out_fpath = self.fpath + '.map'
             print('Writing page ID to file offset mapping to "%s"...' % (out_fpath,))
             with open(out_fpath, 'wt') as out:
                 for id in sorted(pageToAddr.keys()):
@@ -1234,8 +2261,59 @@ class DataBase:
 
             return
 
-        self.pageToAddr[1] = DWORD(self.header.data, 0x2C) & 0xFFFFF
+        if self.index is None and self.indexPath is not None and not verify:
+            self.index = self._loadIndex()
+
+        if self.index is not None:
+            self._restoreIndex(self.index)
+        else:
+            self.pageToAddr[1] = DWORD(self.header.data, 0x2C) & 0xFFFFF
+            self._readPageMaps(verify)
+            self._findSysObjects()
+            self._readSchema()
+            if self.indexPath is not None:
+                self.index = self._buildIndex()
+                self.indexDirty = True
+
+        # Check all the tables
+        for table in self.tables.values():
+            table.validate()
+
+            # TODO Dump the table schema in SQL format?
+
+            # print('Visiting %s...' % (table.name,))
+
+            # Warn if compression is used (we don't support it)
+            if table.compressed:
+                print_err('Warning: table %s is compressed' % (table.name,))
+            for column in table.columns:
+                if column.compressed:
+                    print_err('Warning: column %s.%s is compressed' % (table.name, column.name))
+
+            page = self.readPage(table.pageId)
+            if page is None:
+                raise RuntimeError('cannot read TABLE page %05x for %s'
+                        % (table.pageId, table.name))
+            tablePage = TablePage(page, self)
+            tablePage.validate(self)
+
+            if verify:
+                for idx, record in enumerate(tablePage):
+                    if record is None:
+                        continue
+
+                    row = table.extractRow(record, sortByIndex=True)
+
+                    for n, v in row.items():
+                        if isinstance(v, LvData):
+                            v.extract(self)
 
+                    # TODO Dump the table content in SQL format?
+
+    def _readPageMaps(self, verify):
+        '''
+        Walk MapA and the MapB pages to fill pageToAddr, and read all the TABLE pages.
+        '''
         mapA = self.readPage(1)
         if mapA is None:
             raise RuntimeError('cannot read page 1')
@@ -1264,6 +2342,9 @@ class DataBase:
             pageCover[mapB.type].add(id)
             pageTypes[mapB.type] += 1
 
+            # Pages mapped by this MapB
+            mapped = []
+
             id = 1027 + i * 1527 - 1
             for j in range(1528):
                 id += 1
@@ -1274,17 +2355,30 @@ class DataBase:
 
                 self.pageToAddr[id] = addr
                 maxPageId = id
+                mapped.append((id, addr))
 
-                page = self.readPage(id, validate=False, decrypt=False)
-                if page is None:
+            # Pages that need to be decrypted (in parallel if possible)
+            pending = []
+
+            # Contiguous pages are read at once
+            datas = self._readPagesData([addr for _, addr in mapped])
+            for (id, addr), data in zip(mapped, datas):
+                if data is None:
                     raise RuntimeError('cannot read page %d (at %08x)' % (id, addr))
+
+                page = self._decodePage(id, addr, data, validate=False, decrypt=False)
+                self._addPage(id, page, False)
                 pageTypes[page.type] += 1
 
+                if (page.type == PageType.DATA and verify) or page.type == PageType.TABLE:
+                    pending.append(page)
+
+            self.decryptPages(pending)
+            for page in pending:
                 if page.type == PageType.DATA:
-                    self.decryptPage(page)
                     DataPage(page).validate(self)
+                    self.validDataPages.add(page.id)
                 elif page.type == PageType.TABLE:
-                    self.decryptPage(page)
                     try:
                         tablePage = TablePage(page, self)
                         tablePage.validate(self)
@@ -1294,17 +2388,43 @@ class DataBase:
                         print_err('Warning: %s' % (e,))
 
         self.maxPageId = maxPageId
+        self.pageTypes = pageTypes
+        self.pageCover = pageCover
+        self._printPageStats()
 
+    def _printPageStats(self):
         print('Found %d pages (maxPageId=%06x)' % (len(self.pageToAddr), self.maxPageId))
-        print(', '.join(['%s: %d' % (PageType(t), pageTypes[t]) for t in sorted(pageTypes.keys())]))
+        print(', '.join(['%s: %d' % (PageType(t), self.pageTypes[t])
+                for t in sorted(self.pageTypes.keys())]))
 
-        self.pageCover = pageCover
+    def _isSysObjects(self, tablePage):
+        '''
+        Return True if the records of the TABLE page can be decoded as __SysObjects rows and
+        one of them describes the __SysObjects table.
+        '''
+        try:
+            for record in tablePage:
+                row = SysObjects_table.extractRow(record, sortByIndex=True)
+                if row['ObjectName'] == '__SysObjects':
+                    return True
+        except (RuntimeError, ValueError, IndexError, struct.error) as e:
+            debug_trace('_isSysObjects(%s): %s', tablePage, e)
+        return False
+
+    def _findSysObjects(self):
+        # The TABLE page for __SysObjects is always page 1027 it seems (page 1028 is the root
+        # of its BTREE), so check the known locations first
+        self.SysObjectsPage = None
+        for id in (self.SysObjects_Table, self.SysObjects_BTree):
+            tablePage = self.tablePages.get(id)
+            if tablePage is not None and self._isSysObjects(tablePage):
+                print('Found __SysObjects table at page %05x' % (tablePage.page.id,))
+                self.SysObjectsPage = tablePage
+                return
 
         # Try to find the TABLE page for __SysObjects
         # (we cannot parse BTREE pages yet, so using heuristics instead)
 
-        # FIXME The TABLE page for SysObjects is always page 1027 it seems...
-
         # print('Looking for __SysObjects table...')
         self.SysObjectsPage = None
         for tablePage in self.tablePages.values():
@@ -1323,7 +2443,7 @@ class DataBase:
 
                 # TODO Try to parse the record with the Table method
 
-                prefix = record[93:]
+                prefix = bytes(record[93:])
                 end = prefix.find(0)
                 if end != -1:
                     prefix = prefix[:end]
@@ -1350,6 +2470,7 @@ class DataBase:
         if self.SysObjectsPage is None:
             raise RuntimeError('cannot find __SysObjects table')
 
+    def _readSchema(self):
         # Extract tables definition
         self.tables = {}
         for idx, record in enumerate(self.SysObjectsPage):
@@ -1388,54 +2509,133 @@ class DataBase:
                 print_err('Warning: ignoring unsupported object type %d (for %s)'
                         % (row['ObjectType'], row['ObjectName']))
 
-        # Check all the tables
-        for table in self.tables.values():
-            table.validate()
+    def _getIndexKey(self):
+        '''
+        Return the values identifying the database file in the index: if any of them changes,
+        the index is discarded.
+        '''
+        stat = os.fstat(self.fh.fileno())
+        return {
+            'version': self.INDEX_VERSION,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'header': hashlib.sha1(self.header.data).hexdigest(),
+        }
+
+    def _loadIndex(self):
+        '''
+        Load the index from the sidecar file. Return None if it does not exist, cannot be read
+        or does not match the database file.
+        '''
+        if not os.path.exists(self.indexPath):
+            return None
 
-            # TODO Dump the table schema in SQL format?
+        try:
+            with gzip.open(self.indexPath, 'rt', encoding='utf-8') as fh:
+                index = json.load(fh)
+        except (OSError, EOFError, ValueError) as e:
+            print_err('Warning: cannot read index "%s": %s' % (self.indexPath, e))
+            return None
 
-            # print('Visiting %s...' % (table.name,))
+        if not isinstance(index, dict) or index.get('key') != self._getIndexKey():
+            # Outdated
+            return None
 
-            # Warn if compression is used (we don't support it)
-            if table.compressed:
-                print_err('Warning: table %s is compressed' % (table.name,))
-            for column in table.columns:
-                if column.compressed:
-                    print_err('Warning: column %s.%s is compressed' % (table.name, column.name))
+        return index
+
+    def _buildIndex(self):
+        return {
+            'key': self._getIndexKey(),
+            'maxPageId': self.maxPageId,
+            'pageToAddr': sorted(self.pageToAddr.items()),
+            'pageTypes': sorted(self.pageTypes.items()),
+            'tablePages': sorted(self.tablePages.keys()),
+            'sysObjectsPage': self.SysObjectsPage.page.id,
+            'tables': [table.toDict() for table in self.tables.values()],
+            # TABLE page id => records (see TablePage)
+            'records': {str(id): tablePage.records for id, tablePage in self.tablePages.items()
+                    if tablePage.ready},
+        }
+
+    def _restoreIndex(self, index):
+        '''
+        Restore the state built by _readPageMaps(), _findSysObjects() and _readSchema() from
+        the index.
+        '''
+        if self.indexPath is not None:
+            print('Using index "%s"' % (self.indexPath,))
 
-            page = self.readPage(table.pageId)
+        self.pageToAddr = {id: addr for id, addr in index['pageToAddr']}
+        self.maxPageId = index['maxPageId']
+        self.pageTypes = defaultdict(int, {type: count for type, count in index['pageTypes']})
+        self._printPageStats()
+
+        pageCover = defaultdict(set)
+        pageCover[PageType.HEADER].add(0)
+        pageCover[PageType.MAPA].add(1)
+        for id in range(2, 1027):
+            if id in self.pageToAddr:
+                pageCover[PageType.MAPB].add(id)
+        self.pageCover = pageCover
+
+        for id in index['tablePages']:
+            page = self.readPage(id)
             if page is None:
-                raise RuntimeError('cannot read TABLE page %05x for %s'
-                        % (table.pageId, table.name))
-            tablePage = TablePage(page, self)
-            tablePage.validate(self)
+                raise RuntimeError('cannot read TABLE page %05x' % (id,))
+            self.tablePages[id] = TablePage(page, self)
 
-            if verify:
-                for idx, record in enumerate(tablePage):
-                    if record is None:
-                        continue
+        self.SysObjectsPage = self.tablePages.get(index['sysObjectsPage'])
+        if self.SysObjectsPage is None:
+            raise RuntimeError('cannot find __SysObjects table')
 
-                    row = table.extractRow(record, sortByIndex=True)
+        self.tables = {}
+        for state in index['tables']:
+            table = Table.fromDict(state)
+            self.tables[table.name] = table
 
-                    for n, v in row.items():
-                        if isinstance(v, LvData):
-                            v.extract(self)
+    def saveIndex(self):
+        '''
+        Write the index to the sidecar file if it changed since it was loaded.
+        '''
+        if self.indexPath is None or self.index is None or not self.indexDirty:
+            return
 
-                    # TODO Dump the table content in SQL format?
+        tmpPath = self.indexPath + '.tmp'
+        try:
+            with gzip.open(tmpPath, 'wt', encoding='utf-8') as fh:
+                json.dump(self.index, fh, separators=(',', ':'))
+            os.replace(tmpPath, self.indexPath)
+        except (OSError, TypeError, ValueError) as e:
+            print_err('Warning: cannot write index "%s": %s' % (self.indexPath, e))
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            return
+
+        self.indexDirty = False
+
+    def getRecordMap(self, tablePageId):
+        '''
+        Return the records of a TABLE page stored in the index (see TablePage), or None.
+        '''
+        if self.index is None:
+            return None
+        return self.index['records'].get(str(tablePageId))
+
+    def setRecordMap(self, tablePageId, records):
+        if self.index is None:
+            return
+        self.index['records'][str(tablePageId)] = records
+        self.indexDirty = True
 
     def pageCoverStats(self):
         return ', '.join(['%s: %d' % (PageType(t), len(self.pageCover[t]))
                 for t in sorted(self.pageCover.keys())])
 
     def readPage(self, id, validate=True, decrypt=True, addr=None):
-        cachedPage = self.pageCache.get(id)
-        if id >= 0 and cachedPage is not None:
-            # Update page position in cache
-            for i, pageId in enumerate(self.pageCacheOrder):
-                if pageId == id:
-                    self.pageCacheOrder = self.pageCacheOrder[:i] + self.pageCacheOrder[i+1:] + [id]
-                    break
-            return cachedPage
+        if id >= 0:
+            cachedPage = self.pageCache.get(id)
+            if cachedPage is not None:
+                return cachedPage
 
         if addr is None:
             addr = self.pageToAddr.get(id)
@@ -1443,13 +2643,119 @@ class DataBase:
                 # Not found
                 debug_trace('readPage(id=%05x, address=n/a)', id)
                 return None
-        debug_trace('readPage(id=%05x, address=%08x)', id, addr)
+        if DEBUG_TRACE:
+            debug_trace('readPage(id=%05x, address=%08x)', id, addr)
+
+        data = self._readPageData(addr)
+        if data is None:
+            return None
+
+        page = self._decodePage(id, addr, data, validate=validate, decrypt=decrypt)
+        self._addPage(id, page, validate)
+
+        return page
+
+    def readPages(self, ids, validate=True):
+        '''
+        Read a list of pages. If the database has worker threads, the pages are decrypted and
+        validated in parallel. The pages are returned (and cached) in the same order as ids,
+        with None for the pages that cannot be read.
+        '''
+        pages = [None] * len(ids)
+        missing = []
+        for n, id in enumerate(ids):
+            cachedPage = self.pageCache.get(id)
+            if cachedPage is not None:
+                pages[n] = cachedPage
+                continue
+
+            addr = self.pageToAddr.get(id)
+            if addr is None:
+                debug_trace('readPages(id=%05x, address=n/a)', id)
+                continue
+            if DEBUG_TRACE:
+                debug_trace('readPages(id=%05x, address=%08x)', id, addr)
+            missing.append((n, id, addr))
+
+        jobs = []
+        datas = self._readPagesData([addr for _, _, addr in missing])
+        for (n, id, addr), data in zip(missing, datas):
+            if data is None:
+                continue
+
+            cipher = self._getCipher(data)
+            if self.executor is None:
+                job = self._decodePage(id, addr, data, validate=validate, cipher=cipher)
+            else:
+                job = self.executor.submit(self._decodePage, id, addr, data, validate=validate,
+                        cipher=cipher)
+            jobs.append((n, id, job))
+
+        for n, id, job in jobs:
+            page = job if self.executor is None else job.result()
+            self._addPage(id, page, validate)
+            pages[n] = page
 
-        self.fh.seek(addr * 4096)
-        data = self.fh.read(4096)
+        return pages
+
+    def _readPageData(self, addr):
+        data = self._readRunData(addr, 1)
         if len(data) != 4096:
             return None
+        return data
+
+    def _readPagesData(self, addrs):
+        '''
+        Read the data of the pages at the given addresses, with a single read for each run of
+        contiguous addresses (up to READ_RUN_MAX pages). Return the data in the same order as
+        addrs, with None for the pages that cannot be read.
+        '''
+        result = []
+        n = 0
+        while n < len(addrs):
+            start = addrs[n]
+            count = 1
+            while (n + count < len(addrs) and count < self.READ_RUN_MAX
+                    and addrs[n + count] == start + count):
+                count += 1
+
+            data = self._readRunData(start, count)
+            for i in range(count):
+                # Each page gets its own copy (a view with the mmap backend), so the run
+                # buffer is not kept alive by the cached pages
+                pageData = data[i*4096:(i+1)*4096]
+                result.append(pageData if len(pageData) == 4096 else None)
+            n += count
+
+        return result
+
+    def _readRunData(self, addr, count):
+        size = count * 4096
+        if self.view is not None:
+            pos = addr * 4096
+            data = self.view[pos:pos+size]
+        elif hasattr(os, 'pread'):
+            # Positional read, the file offset is not shared between threads
+            data = os.pread(self.fh.fileno(), size, addr * 4096)
+        else:
+            with self.fileLock:
+                self.fh.seek(addr * 4096)
+                data = self.fh.read(size)
+        self.metrics.addRead(len(data))
+        return data
+
+    def _getCipher(self, data):
+        '''Return the cipher to decrypt the page data, or None if it is not encrypted.'''
+        pageType = (DWORD(data, 4) >> 20) & 0xF
+        if self.key is None or pageType <= 2:
+            return None
+        return self.keyCache.get(data[:4])
 
+    def _decodePage(self, id, addr, data, validate=True, decrypt=True, cipher=None):
+        '''
+        Decrypt and validate the page data. This method may be called from worker threads, so
+        it must not modify the state of the database.
+        '''
         dword_0 = DWORD(data, 0)
         dword_1 = DWORD(data, 4)
 
@@ -1460,42 +2766,190 @@ class DataBase:
         decrypted = self.key is None
         if self.key is not None and pageType > 2 and decrypt:
             # Page is encrypted (using checksum as key)
-            data = data[:16] + decrypt_bytes(self.key_hash, data[:4], data[16:])
+            start = time.perf_counter()
+            if cipher is None:
+                cipher = self.keyCache.get(data[:4])
+            data = bytes(data[:16]) + decrypt_bytes(self.key_hash, data[:4], data[16:],
+                    cipher=cipher)
             decrypted = True
+            self.metrics.addDecrypt(time.perf_counter() - start)
+
+        if decrypted and validate:
+            start = time.perf_counter()
+            valid = checksum == do_checksum(data[4:])
+            self.metrics.addChecksum(time.perf_counter() - start)
+            if not valid:
+                raise RuntimeError('bad checksum for page %d (at %08x)' % (id, addr))
 
-        if decrypted and validate and checksum != do_checksum(data[4:]):
-            raise RuntimeError('bad checksum for page %d (at %08x)' % (id, addr))
+        return Page(pageId, pageType, data, addr*4096, decrypted=decrypted)
 
-        page = Page(pageId, pageType, data, addr*4096, decrypted=decrypted)
+    def _addPage(self, id, page, validate):
+        self.metrics.addPage(page.type)
 
-        if id >= 0 and decrypted and validate and pageType != PageType.LV:
+        if id >= 0 and page.decrypted and validate and page.type != PageType.LV:
             # Cache the page
-            self.pageCache[id] = page
-            self.pageCacheOrder.append(id)
-            if len(self.pageCacheOrder) > 100:
-                # Remove oldest cached page
-                del self.pageCache[self.pageCacheOrder[0]]
-                self.pageCacheOrder = self.pageCacheOrder[1:]
+            self.pageCache.put(id, page)
 
         if self.pageCover is not None:
             self.pageCover[page.type].add(page.id)
 
-        return page
+    def getTablePage(self, table):
+        page = self.readPage(table.pageId)
+        if page is None:
+            raise RuntimeError('cannot read TABLE page %05x for %s' % (table.pageId, table.name))
+        return TablePage(page, self)
 
-    def decryptPage(self, page, validate=True):
+    def readDataPages(self, ids):
+        '''
+        Read a list of DATA pages (see readPages()) and validate their content the first time
+        they are read.
+        '''
+        dataPages = []
+        for id, page in zip(ids, self.readPages(ids)):
+            if page is None:
+                raise RuntimeError('cannot read DATA page %05x' % (id,))
+
+            dataPage = DataPage(page)
+            if id not in self.validDataPages:
+                dataPage.validate(self)
+                self.validDataPages.add(id)
+            dataPages.append(dataPage)
+
+        return dataPages
+
+    def readDataPage(self, id):
+        '''
+        Read a DATA page and validate its content the first time it is read.
+        '''
+        page = self.readPage(id, validate=True)
+        if page is None:
+            raise RuntimeError('cannot read DATA page %05x' % (id,))
+
+        dataPage = DataPage(page)
+        if id not in self.validDataPages:
+            dataPage.validate(self)
+            self.validDataPages.add(id)
+
+        return dataPage
+
+    def decryptPage(self, page, validate=True, cipher=None):
         if page.decrypted:
             return
 
         if self.key is not None and page.type > 2:
             # Page is encrypted (using checksum as key)
-            page.data = page.data[:16] + decrypt_bytes(self.key_hash, page.data[:4], page.data[16:])
+            start = time.perf_counter()
+            if cipher is None:
+                cipher = self.keyCache.get(page.data[:4])
+            page.data = bytes(page.data[:16]) + decrypt_bytes(self.key_hash, page.data[:4],
+                    page.data[16:], cipher=cipher)
+            self.metrics.addDecrypt(time.perf_counter() - start)
 
         page.decrypted = True
 
         if validate:
+            start = time.perf_counter()
             checksum = DWORD(page.data, 0)
-            if checksum != do_checksum(page.data[4:]):
-                raise RuntimeError('bad checksum for page %d (at %08x)' % (id, addr))
+            valid = checksum == do_checksum(page.data[4:])
+            self.metrics.addChecksum(time.perf_counter() - start)
+            if not valid:
+                raise RuntimeError('bad checksum for page %d (at %08x)' % (page.id, page.address))
+
+    def decryptPages(self, pages, validate=True):
+        '''
+        Decrypt a list of pages, in parallel if the database has worker threads.
+        '''
+        if self.executor is None:
+            for page in pages:
+                self.decryptPage(page, validate=validate)
+            return
+
+        jobs = []
+        for page in pages:
+            if page.decrypted:
+                continue
+            cipher = self._getCipher(page.data)
+            jobs.append(self.executor.submit(self.decryptPage, page, validate=validate,
+                    cipher=cipher))
+        for job in jobs:
+            job.result()
+
+    def getGroupIndex(self, table, column):
+        '''
+        Return the GroupIndex of the column (name) of the table (name or Table instance). It is
+        built the first time it is requested.
+        '''
+        if not isinstance(table, Table):
+            table = self.tables[table]
+
+        groupIndex = self.groupIndexes.get((table.name, column))
+        if groupIndex is None:
+            groupIndex = self.buildGroupIndexes(table, [column])[column]
+        return groupIndex
+
+    def buildGroupIndexes(self, table, columns):
+        '''
+        Build the GroupIndex of several columns (names) of the table (name or Table instance)
+        in a single pass over the records, only decoding these columns. Return a dict
+        {column name: GroupIndex}.
+        '''
+        if not isinstance(table, Table):
+            table = self.tables[table]
+
+        # Share the records map between the indexes of the table
+        tablePage = None
+        for (tableName, _), groupIndex in self.groupIndexes.items():
+            if tableName == table.name:
+                tablePage = groupIndex.tablePage
+                break
+        if tablePage is None:
+            tablePage = self.getTablePage(table)
+
+        # The records are mapped in the same pass, so getGroup() reads only the records of
+        # the group, without walking the table again
+        result = {}
+        values = table.extractColumns(tablePage.iterRecords(mapRecords=True), columns)
+        for name in columns:
+            groupIndex = GroupIndex(self, table, table.getColumn(name), tablePage=tablePage,
+                    values=values[name])
+            self.groupIndexes[(table.name, name)] = groupIndex
+            result[name] = groupIndex
+        return result
+
+    def getGroup(self, table, column, value):
+        '''
+        Return the rows of the table whose column value is value, using the group index of
+        the column (built on first use).
+        '''
+        groupIndex = self.getGroupIndex(table, column)
+        return [groupIndex.table.extractRow(groupIndex.tablePage.getRecord(pos),
+                sortByIndex=True) for pos in groupIndex.find(value)]
+
+    def getMetrics(self):
+        '''
+        Return a snapshot of the metrics of the database as a dict that can be serialized to
+        JSON. Times are in seconds.
+        '''
+        rowsDecoded = {}
+        for table in self.tables.values():
+            with table.rowsLock:
+                rowsDecoded[table.name] = table.rowsDecoded
+
+        # The counters may be updated by other threads meanwhile
+        metrics = self.metrics
+        with metrics.lock:
+            return {
+                'pagesRead': {str(PageType(t)): count
+                        for t, count in sorted(metrics.pagesRead.items())},
+                'reads': metrics.reads,
+                'bytesRead': metrics.bytesRead,
+                'pageCache': self.pageCache.stats(),
+                'keyCache': self.keyCache.stats() if self.key is not None else None,
+                'decrypt': {'calls': metrics.decryptCalls, 'time': metrics.decryptTime},
+                'checksum': {'calls': metrics.checksumCalls, 'time': metrics.checksumTime},
+                'lvBytes': metrics.lvBytes,
+                'rowsDecoded': rowsDecoded,
+            }
 
     def checkId(self, id):
         if id == 0xFFFF:
@@ -1508,11 +2962,569 @@ class DataBase:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.fh.close()
-        self.fh = None
+        self.close()
+
+    def close(self):
+        if self.fh is not None:
+            self.saveIndex()
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+        self.pageCache.clear()
+        self.tablePages = {}
+        self.groupIndexes = {}
+        self.header = None
+
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                # Some pages are still referenced, the mapping will be released with them
+                pass
+            self.mmap = None
+
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+# SQLite column type of each column type
+SQLITE_TYPES = {
+    Column.TYPE_TINYINT.value:          'INTEGER',
+    Column.TYPE_SMALLINT.value:         'INTEGER',
+    Column.TYPE_USHORT.value:           'INTEGER',
+    Column.TYPE_INTEGER.value:          'INTEGER',
+    Column.TYPE_ULONG.value:            'INTEGER',
+    Column.TYPE_BIGINT.value:           'INTEGER',
+    Column.TYPE_UBIGINT.value:          '',  # No affinity: values > 2^63-1 are stored as TEXT
+    Column.TYPE_NCHAR.value:            'TEXT',
+    Column.TYPE_NVARCHAR.value:         'TEXT',
+    Column.TYPE_NTEXT.value:            'TEXT',
+    Column.TYPE_BINARY.value:           'BLOB',
+    Column.TYPE_VARBINARY.value:        'BLOB',
+    Column.TYPE_IMAGE.value:            'BLOB',
+    Column.TYPE_DATETIME.value:         'TEXT',
+    Column.TYPE_UNIQUEIDENTIFIER.value: 'BLOB',
+    Column.TYPE_BIT.value:              'INTEGER',
+    Column.TYPE_REAL.value:             'REAL',
+    Column.TYPE_FLOAT.value:            'REAL',
+    Column.TYPE_MONEY.value:            'REAL',
+    Column.TYPE_NUMERIC.value:          'NUMERIC',
+    Column.TYPE_ROWVERSION.value:       'INTEGER',
+}
+
+def sqlite_quote(name):
+    return '"%s"' % (name.replace('"', '""'),)
+
+def sqlite_value(value, db):
+    '''
+    Convert a value returned by Table.extractRow() to a value SQLite can store.
+    '''
+    if isinstance(value, LvData):
+        value = value.extract(db)
+    if isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    if isinstance(value, int) and not (-0x8000000000000000 <= value <= 0x7FFFFFFFFFFFFFFF):
+        # Does not fit in a SQLite INTEGER (ubigint)
+        return str(value)
+    return value
+
+def export_sqlite(db, fpath, tables=None, batch_size=10000):
+    '''
+    Export the tables (all by default) of the database to a new SQLite database. Each table
+    is created from its definition and filled in a single transaction, batch_size rows at a
+    time. LV data is stored as TEXT or BLOB depending on the column type.
+    '''
+    import sqlite3
+
+    if tables is None:
+        tables = list(db.tables.values())
+
+    conn = sqlite3.connect(fpath)
+    try:
+        # The file is written from scratch, no need to be able to recover from a crash
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+
+        for table in tables:
+            columns = []
+            for column in table.columns:
+                sqlType = SQLITE_TYPES[column.type.value]
+                columns.append(sqlite_quote(column.name) + (' ' + sqlType if sqlType else ''))
+            conn.execute('CREATE TABLE %s (%s)' % (sqlite_quote(table.name), ', '.join(columns)))
+
+            query = 'INSERT INTO %s VALUES (%s)' % (sqlite_quote(table.name),
+                    ', '.join(['?'] * len(table.columns)))
+
+            count = 0
+            batch = []
+            with conn:
+                for record in db.getTablePage(table):
+                    if record is None:
+                        continue
+
+                    row = table.extractRow(record, sortByIndex=True)
+                    batch.append([sqlite_value(value, db) for value in row.values()])
+                    if len(batch) == batch_size:
+                        conn.executemany(query, batch)
+                        count += len(batch)
+                        batch = []
+
+                if batch:
+                    conn.executemany(query, batch)
+                    count += len(batch)
+
+            print('Exported %d rows from %s' % (count, table.name))
+    finally:
+        conn.close()
+
+def json_value(value):
+    '''
+    Convert a value returned by Table.extractRow() (except LvData) to a JSON value.
+    '''
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'$base64': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def safe_filename(name):
+    return re.sub(r'[^\w.-]', '_', name)
+
+def dump_ndjson(db, out, table, lv_dir=None, inline_size=0x10000, with_table=False):
+    '''
+    Write the rows of the table to the text file object out, one JSON object per line, as
+    they are decoded. Return the number of rows written.
+
+    LV data up to inline_size bytes is stored in the row. Larger LV data is written to a file
+    in lv_dir and the row gives its path ({"$file": path, "size": size}). If lv_dir is None,
+    the row gives its size ({"$lv": size, "encoding": encoding}) and the raw data follows in
+    one line per LV page ({"_lv": column, "_table": table, "_row": row, "offset": offset,
+    "size": size, "data": base64}), where row is the position of the row in the table
+    (starting at 0, as in the names of the files written to lv_dir).
+
+    If with_table is True, the table name is added to each row as "_table".
+    '''
+    count = 0
+    for record in db.getTablePage(table):
+        if record is None:
+            continue
+
+        row = table.extractRow(record, sortByIndex=True)
+
+        obj = {'_table': table.name} if with_table else {}
+        lvChunks = []  # LV data to write after the row
+        for name, value in row.items():
+            if isinstance(value, LvData):
+                if value.size <= inline_size:
+                    value = value.extract(db)
+                elif lv_dir is not None:
+                    fname = '%d.%s.bin' % (count, safe_filename(name))
+                    os.makedirs(lv_dir, exist_ok=True)
+                    with open(os.path.join(lv_dir, fname), 'wb') as fh:
+                        value.extractTo(db, fh)
+                    obj[name] = {'$file': os.path.join(os.path.basename(lv_dir), fname),
+                            'size': value.size}
+                    continue
+                else:
+                    obj[name] = {'$lv': value.size, 'encoding': value.encoding}
+                    lvChunks.append((name, value))
+                    continue
+
+            obj[name] = json_value(value)
+
+        out.write(json.dumps(obj, ensure_ascii=False))
+        out.write('\n')
+
+        for name, value in lvChunks:
+            offset = 0
+            for chunk in value.iterChunks(db):
+                out.write(json.dumps({'_lv': name, '_table': table.name, '_row': count,
+                        'offset': offset, 'size': len(chunk),
+                        'data': base64.b64encode(chunk).decode('ascii')}, ensure_ascii=False))
+                out.write('\n')
+                offset += len(chunk)
+
+        count += 1
+
+    return count
+
+# Number of pages checked by each verify_database() page task
+VERIFY_PAGES_CHUNK = 1024
+
+def _page_address(db, id):
+    addr = db.pageToAddr.get(id)
+    return None if addr is None else addr * 4096
+
+def verify_pages(db, ids):
+    '''
+    Read the pages and check their checksum. Return (problems, lvPageIds) where problems is a
+    list of (kind, pageId, address, message) and lvPageIds is the list of the LV pages found
+    (even if their checksum is wrong).
+    '''
+    problems = []
+    lvPageIds = []
+    addrs = [db.pageToAddr[id] for id in ids]
+    for id, addr, data in zip(ids, addrs, db._readPagesData(addrs)):
+        if data is None:
+            problems.append(('read', id, addr * 4096, 'cannot read page %05x' % (id,)))
+            continue
+
+        if (DWORD(data, 4) >> 20) & 0xF == PageType.LV:
+            lvPageIds.append(id)
+
+        try:
+            db._decodePage(id, addr, data)
+        except RuntimeError as e:
+            problems.append(('checksum', id, addr * 4096, str(e)))
+
+    return problems, lvPageIds
+
+def _read_record(db, pageId, idx, entry):
+    '''
+    Follow the continuation chain of the record starting at entry idx of DATA page pageId and
+    return its data. Raise RuntimeError if the chain is broken.
+    '''
+    data = entry
+    seen = set([(pageId, idx)])
+    nextChunk = DWORD(entry)
+    while (nextChunk >> 12) != 0:
+        chunk = (nextChunk >> 12, nextChunk & 0xFFF)  # pageId, entryId
+        if chunk in seen:
+            raise RuntimeError('continuation entry %d of page %05x is already in the chain'
+                    % (chunk[1], chunk[0]))
+        seen.add(chunk)
+
+        dataPage = db.readDataPage(chunk[0])
+        if chunk[1] >= dataPage.entriesCount:
+            raise RuntimeError('continuation entry %d of page %05x does not exist'
+                    % (chunk[1], chunk[0]))
+        flags, entry = dataPage.getEntry(chunk[1])
+        if entry is None:
+            raise RuntimeError('continuation entry %d of page %05x is free' % (chunk[1], chunk[0]))
+        if (flags & 2) != 0:
+            raise RuntimeError('continuation entry %d of page %05x is the start of a record'
+                    % (chunk[1], chunk[0]))
+
+        if not isinstance(data, bytearray):
+            data = bytearray(data)
+        # Remove the first 4 bytes when adding continuation entries
+        data += entry[4:]
+        nextChunk = DWORD(entry)
+
+    return data
+
+def verify_table(db, table):
+    '''
+    Follow the continuation chains of all the records of the table, decode the rows and check
+    the size of their LV data. The LV pages content is not read (see verify_pages()).
+    Return (problems, rowCount, lvRefs) where problems is a list of (kind, pageId, address,
+    message) and lvRefs is a list of (pageId, column, entryIdx, lvPageIds) for the LV data of
+    each row.
+    '''
+    problems = []
+    rows = 0
+    lvRefs = []
+
+    try:
+        tablePage = db.getTablePage(table)
+        dataPageIds = tablePage._getDataPageIds()
+    except (RuntimeError, ValueError) as e:
+        problems.append(('table', table.pageId, _page_address(db, table.pageId),
+                '%s: %s' % (table.name, e)))
+        return problems, rows, lvRefs
+
+    for id in dataPageIds:
+        try:
+            dataPage = db.readDataPage(id)
+        except (RuntimeError, ValueError) as e:
+            problems.append(('table', id, _page_address(db, id), '%s: %s' % (table.name, e)))
+            continue
+
+        for idx, (flags, entry) in enumerate(dataPage):
+            if entry is None or (flags & 2) == 0:
+                continue
+
+            try:
+                record = _read_record(db, id, idx, entry)
+            except (RuntimeError, ValueError) as e:
+                problems.append(('chain', id, _page_address(db, id),
+                        '%s: record entry %d: %s' % (table.name, idx, e)))
+                continue
+
+            try:
+                row = table.extractRow(record, sortByIndex=True)
+            except Exception as e:
+                # Any error is reported, the record data may be anything
+                problems.append(('row', id, _page_address(db, id),
+                        '%s: record entry %d: %s' % (table.name, idx, e)))
+                continue
+            rows += 1
+
+            for name, value in row.items():
+                if not isinstance(value, LvData):
+                    continue
+
+                try:
+                    lvPageIds = value.getPageIds(db)
+                except RuntimeError as e:
+                    problems.append(('lv', id, _page_address(db, id),
+                            '%s.%s: record entry %d: %s' % (table.name, name, idx, e)))
+                    continue
+
+                pageCount = math.ceil(value.size / (4096 - 16))
+                if len(lvPageIds) != pageCount:
+                    problems.append(('lv', id, _page_address(db, id),
+                            '%s.%s: record entry %d: %d LV pages for %d bytes (expected %d)'
+                            % (table.name, name, idx, len(lvPageIds), value.size, pageCount)))
+                lvRefs.append((id, '%s.%s' % (table.name, name), idx, lvPageIds))
+
+    return problems, rows, lvRefs
+
+_verify_db = None
+
+def _verify_init(fpath, key, index):
+    '''Open the database in a verify_database() worker process, from the index of the main one.'''
+    global _verify_db, DEBUG_TRACE
+    DEBUG_TRACE = False
+
+    # The main process already showed the database info and warnings
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        _verify_db = DataBase(fpath, key, index=index)
+
+def _verify_task(task):
+    kind, arg = task
+    if kind == 'pages':
+        return verify_pages(_verify_db, arg)
+    return verify_table(_verify_db, _verify_db.tables[arg])
+
+def verify_database(db, jobs=None):
+    '''
+    Check the integrity of the whole database: checksum of all the pages, continuation chains
+    and decoding of all the records, and size of all the LV data.
+
+    The work is split into one task per table and one task per VERIFY_PAGES_CHUNK pages (which
+    are mostly LV pages), run by jobs worker processes (os.cpu_count() if None). Each worker
+    opens the database file on its own, but gets the page map and the schema from the index of
+    db instead of reading them again. The tasks are run in this process if jobs is 1.
+
+    Return a dict with the number of pages, tables and rows checked, and the list of problems
+    found as (kind, pageId, address, message) sorted by address. kind is "read", "checksum",
+    "table", "chain", "row" or "lv".
+    '''
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    # Pages are checked in file order, so they are read in large runs
+    ids = sorted(db.pageToAddr, key=lambda id: db.pageToAddr[id])
+    tasks = [('table', name) for name in db.tables]
+    tasks += [('pages', ids[n:n+VERIFY_PAGES_CHUNK])
+            for n in range(0, len(ids), VERIFY_PAGES_CHUNK)]
+
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        index = db.index if db.index is not None else db._buildIndex()
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_verify_init,
+                initargs=(db.fpath, db.key, index)) as executor:
+            results = list(executor.map(_verify_task, tasks))
+    else:
+        results = []
+        for kind, arg in tasks:
+            if kind == 'pages':
+                results.append(verify_pages(db, arg))
+            else:
+                results.append(verify_table(db, db.tables[arg]))
+
+    problems = []
+    lvPageIds = set()
+    lvRefs = []
+    rows = 0
+    for (kind, _), result in zip(tasks, results):
+        problems += result[0]
+        if kind == 'pages':
+            lvPageIds.update(result[1])
+        else:
+            rows += result[1]
+            lvRefs += result[2]
+
+    # LV data must only be stored in LV pages
+    for id, column, idx, pageIds in lvRefs:
+        for lvPageId in pageIds:
+            if lvPageId not in lvPageIds:
+                problems.append(('lv', id, _page_address(db, id),
+                        '%s: record entry %d: page %05x is not an LV page'
+                        % (column, idx, lvPageId)))
+                break
+
+    problems.sort(key=lambda p: (-1 if p[2] is None else p[2], p[1]))
+    return {
+        'pages': len(ids),
+        'tables': len(db.tables),
+        'rows': rows,
+        'problems': problems,
+    }
+
+def database_key(args):
+    '''
+    Return the database key given on the command line of main().
+    '''
+    if args.key is not None:
+        return bytes.fromhex(args.key)
+    if args.password is not None:
+        return args.password.encode('utf-16-le')
+    return None
+
+# Passwords of the keys used by RAGS games (see key_gen() in rags2html.py)
+RAGS_PASSWORDS = ('F1$asDDFHappy', 'DBPassword')
+
+def open_database(args, **kwargs):
+    '''
+    Open the database given on the command line of main(). If no key is given, the keys used
+    by RAGS games are tried (the database is opened without a key if none of them matches).
+    kwargs are given to DataBase().
+    '''
+    key = database_key(args)
+    probe = None
+    if key is None:
+        from rags2html import key_gen
+        probe = probe_file(args.sdf_file, [key_gen(password) for password in RAGS_PASSWORDS])
+    return DataBase(args.sdf_file, key, probe=probe, **kwargs)
 
 def main(argv):
-    # TODO Let user dump schema and full DB
+    import argparse
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('sdf_file')
+    common.add_argument('-p', '--password', help='database password (default: try the RAGS keys)')
+    common.add_argument('-k', '--key', help='database key, in hexadecimal (instead of --password)')
+
+    reader = argparse.ArgumentParser(add_help=False, parents=[common])
+    reader.add_argument('-j', '--threads', type=int, help='number of threads used to decrypt the database (default: 1)', default=1)
+    reader.add_argument('--index', action='store_true', help='store the database structure in a sidecar file (%s) to load it faster next time' % (DataBase.INDEX_SUFFIX,))
+    reader.add_argument('--metrics', action='store_true', help='print the database metrics (JSON) to stderr when done')
+
+    parser = argparse.ArgumentParser(description='Extract data from Microsoft SQL CE database files (SDF)')
+    commands = parser.add_subparsers(dest='command', metavar='command', required=True)
+
+    export = commands.add_parser('export', parents=[reader], help='export the database to another format')
+    export.add_argument('--sqlite', required=True, metavar='OUT_FILE', help='SQLite database to create')
+    export.add_argument('-t', '--table', action='append', help='table to export (default: all tables)')
+    export.add_argument('-f', '--force', action='store_true', help='overwrite the output file if it exists')
+
+    dump = commands.add_parser('dump', parents=[reader], help='dump the rows of the tables as they are decoded')
+    dump.add_argument('--ndjson', action='store_true', required=True, help='one JSON object per row')
+    dump.add_argument('-o', '--out-dir', help='write each table to OUT_DIR/TABLE.ndjson and large LV data to OUT_DIR/TABLE/ (default: all tables to stdout)')
+    dump.add_argument('-t', '--table', action='append', help='table to dump (default: all tables)')
+    dump.add_argument('--inline-size', type=int, default=0x10000, help='max size of the LV data stored in the rows (default: 65536)')
+
+    verify = commands.add_parser('verify', parents=[common], help='check the integrity of the whole database')
+    verify.add_argument('-j', '--jobs', type=int, help='number of worker processes (default: number of CPUs)')
+
+    args = parser.parse_args(args=argv[1:])
+
+    global DEBUG_TRACE
+    DEBUG_TRACE = False
+
+    if args.command == 'verify':
+        return run_verify(args)
+
+    stdout = sys.stdout
+    if args.command == 'dump' and args.out_dir is None:
+        # stdout is used for the rows, print the messages to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            return run_command(args, stdout)
+    return run_command(args, stdout)
+
+def run_verify(args):
+    start = time.perf_counter()
+    try:
+        db = open_database(args)
+    except (RuntimeError, ValueError, IndexError) as e:
+        # The structure of the database (page maps, schema) must be readable to go further
+        print_err('Error: cannot open database: %s' % (e,))
+        return 1
+
+    with db:
+        report = verify_database(db, args.jobs)
+
+    for kind, pageId, address, message in report['problems']:
+        print('%s: page %05x (at %s): %s' % (kind, pageId,
+                'n/a' if address is None else '%08x' % (address,), message))
+    print('Checked %d pages and %d rows of %d tables in %.2fs: %d problem(s) found'
+            % (report['pages'], report['rows'], report['tables'], time.perf_counter() - start,
+            len(report['problems'])))
+
+    return 1 if report['problems'] else 0
+
+def run_command(args, stdout):
+    try:
+        db = open_database(args, workers=args.threads, index=args.index or None)
+    except (RuntimeError, ValueError, IndexError) as e:
+        print_err('Error: cannot open database: %s' % (e,))
+        return 1
+
+    with db:
+        try:
+            return run_database_command(args, db, stdout)
+        except RuntimeError as e:
+            print_err('Error: %s' % (e,))
+            return 1
+
+def run_database_command(args, db, stdout):
+    tables = None
+    if args.table:
+        tables = []
+        for name in args.table:
+            table = db.tables.get(name)
+            if table is None:
+                print_err('Error: cannot find table %s' % (name,))
+                return 1
+            tables.append(table)
+
+    if args.command == 'export':
+        if os.path.exists(args.sqlite):
+            if not args.force:
+                print_err('Error: "%s" already exists' % (args.sqlite,))
+                return 1
+            os.remove(args.sqlite)
+
+        export_sqlite(db, args.sqlite, tables)
+
+    elif args.command == 'dump':
+        if tables is None:
+            tables = list(db.tables.values())
+
+        if args.out_dir is None:
+            try:
+                for table in tables:
+                    dump_ndjson(db, stdout, table, inline_size=args.inline_size,
+                            with_table=True)
+                stdout.flush()
+            except BrokenPipeError:
+                # The reader stopped (e.g. "| head"), do not complain when stdout is closed
+                os.dup2(os.open(os.devnull, os.O_WRONLY), stdout.fileno())
+                return 0
+        else:
+            os.makedirs(args.out_dir, exist_ok=True)
+            for table in tables:
+                name = safe_filename(table.name)
+                lv_dir = os.path.join(args.out_dir, name)
+                with open(os.path.join(args.out_dir, name + '.ndjson'), 'wt',
+                        encoding='utf-8') as out:
+                    count = dump_ndjson(db, out, table, lv_dir=lv_dir,
+                            inline_size=args.inline_size)
+                print('Dumped %d rows from %s' % (count, table.name))
+
+    if args.metrics:
+        print_err(json.dumps(db.getMetrics(), indent=2))
+
     return 0
 
 if __name__ == '__main__':